@@ -1,251 +1,472 @@
 # Import necessary libraries
-import pandas as pd
+import os
+
 import seaborn as sns
 import matplotlib.pyplot as plt
 
-# Load the cleaned dataset
-df = pd.read_csv('02_data_clean/sales_data_clean.csv')
-
-# Step 1: Correlation Between Products
-# I’ll check how different products are correlated with each other to see if there's a relationship
-# in sales.
-# This is useful for understanding if the sales of one product are linked with another.
-# Step 1: Correlation Between Products
-#
-# In this step, I want to understand if the sales of different products
-# are related to each other. To do this, I am calculating the *correlation*
-# between products.
-#
-# What does correlation mean? Basically, it tells me how much two things
-# move together. The value goes from -1 to +1:
-#
-# +1 means they move exactly the same (strong positive link).
-#  0 means there is no connection between them.
-# -1 means they move in the opposite direction (strong negative link).
-#
-# For example:
-# If M01AB and M01AE both go up and down at the same time,
-# their correlation might be around 0.90 or even higher.
-#
-# But if M01AB goes up and M01AE goes down, the correlation will be
-# negative, like -0.5.
-#
-# If there’s no pattern at all between them, the correlation will be close to 0.
-#
-# Why am I doing this?
-# It helps me find out if customers are buying some products together.
-#
-# For example, maybe when people buy painkillers (like N02BA),
-# they also buy cough medicines (like R03).
-#
-# That would be useful to know for making marketing plans or
-# product bundles.
-#
-# Now I’m going to select the product columns I want to check,
-# and then use the .corr() function to create a correlation matrix.
-
-correlation_matrix = df[['m01ab', 'm01ae', 'n02ba', 'n02be', 'n05b', 'n05c', 'r03', 'r06']].corr()
-
-# Visualize the correlation matrix using a heatmap
-
-# Now I want to **visualize** the correlation matrix I created.
-#
-# I’m using a heatmap for this, which is basically a colored table
-# that shows how strongly the products are related to each other.
-#
-# Dark red means strong positive correlation (closer to +1).
-# Dark blue means strong negative correlation (closer to -1).
-# White or light shades mean weak or no correlation (close to 0).
-#
-# I’m using seaborn’s heatmap() function to do this.
-#
-# figsize=(10, 8) makes the plot bigger so it’s easier to read.
-#
-# annot=True means the actual numbers (like 0.92, -0.35) will show up
-# inside the boxes.if annot = False then there will be only colour inside
-# the chart no values.
-#
-# cmap='coolwarm' sets the color scheme — warm colors for positive,
-# cool colors for negative.
-#
-# fmt='.2f' means round the numbers to 2 decimal places.
-#
-# cbar=True adds the color scale bar on the side so I can see
-# what the colors mean.with cbar = False there will be no
-# colour bar at the side of the chart for me to view and know
-# what each colour means.
-#
-# Finally, I added a title to explain what the chart is showing.
-# plt.show() displays the chart.
-
-plt.figure(figsize=(10, 8))
-sns.heatmap(correlation_matrix, annot=True, cmap='coolwarm', fmt='.2f', cbar=True)
-plt.title('Correlation Between Products', fontsize=16)
-plt.show()
-
-# Step 2: Moving Averages & Seasonality
-# To observe seasonality in the data, I will calculate a moving average for the sales of a few products.
-# This helps in smoothing out fluctuations and identifying clear patterns over time.
-# Now I’m going to calculate the moving average for product M01AB.
-#
-# I use .rolling(window=30) to create a 30-day moving window.
-# This means it will look at the last 30 rows (30 days of sales).
-#
-# Then I use .mean() to get the average of those 30 days.
-#
-# So instead of just showing one day’s sales,
-# it shows the average sales from the past 30 days.
-#
-# This helps smooth out any daily ups and downs in the data.
-#
-# The result is stored in a new column called 'm01ab_rolling_avg'.
-#
-# I do the same for M01AE — calculating its 30-day moving average
-# and saving it in a column called 'm01ae_rolling_avg'.
-#
-# These rolling averages will help me see the sales trend
-# more clearly when I plot them.
-# I'm calculating a 30-day rolling average for product sales.
-# This helps smooth out daily "noise" — random ups and downs in sales.
-# For example, sales may jump from 200 to 120 to 300 in three days.
-# That doesn’t mean a real trend — it’s just noise (like weather or discounts).
-# So I use a 30-day window to get a clearer pattern.
-# How it works:
-# - First it averages sales from Day 1 to Day 30.
-# - Then Day 2 to Day 31, then Day 3 to Day 32, and so on.
-# This rolling average is useful to reveal real trends (like seasonality or growth).
-
-df['m01ab_rolling_avg'] = df['m01ab'].rolling(window=30).mean() # for product M01AB,30-day moving average
-
-# same as upper step i want to see the rolling average of this product also.
-
-df['m01ae_rolling_avg'] = df['m01ae'].rolling(window=30).mean()
-
-# First, I'm creating a new figure for the plot and setting its size.
-# This makes sure the chart is wide enough to clearly see the lines.
-
-plt.figure(figsize=(12, 6))
-
-# This line plots the **original M01AB daily sales**
-# It uses 'datum' (date) for the x-axis and 'm01ab' (sales) for the y-axis.
-# The line will look a bit jagged(rough/uneven) because it's showing the actual ups and downs every day.
-# The 'alpha=0.7' makes the line a little bit transparent so overlapping lines are easier to see.
-
-plt.plot(df['datum'], df['m01ab'], label='M01AB Sales', alpha=0.7)
-
-# This line plots the **30-day rolling average for M01AB**
-# It's a smoother version of the original sales line, showing the trend over time.
-# The 'linestyle="--"' makes it a dashed line so i can easily tell it apart from the original sales line
-
-plt.plot(df['datum'], df['m01ab_rolling_avg'], label='M01AB Rolling Avg', linestyle='--')
-
-# This line plots the **original M01AE daily sales**
-# Just like before, it shows the real daily sales of another product (M01AE).
-# Again, using 'alpha=0.7' to help with visibility when lines overlap.
-
-plt.plot(df['datum'], df['m01ae'], label='M01AE Sales', alpha=0.7)
-
-# This line plots the **30-day rolling average for M01AE**
-# It shows the smoothed-out sales trend for M01AE over time.
-# Dashed line again to keep it visually separate from the original sales.
-
-plt.plot(df['datum'], df['m01ae_rolling_avg'], label='M01AE Rolling Avg', linestyle='--')
-
-# Setting the title of the chart so it's clear what the plot is about.
-
-plt.title('Sales & Moving Averages of M01AB and M01AE', fontsize=16)
-
-# Labeling the x-axis to show that it represents dates.
-
-plt.xlabel('Date')
-
-# Labeling the y-axis to show that it represents sales numbers.
-
-plt.ylabel('Sales')
-
-# 🧭 Adding a legend so viewers know which line is which.
-plt.legend()
-
-# 👀 Finally, showing the plot so it appears on screen.
-plt.show()
-
-# Step 3: Sales by Weekday & Hour
-# I’ll analyze how sales change depending on the day of the week and hour of the day.
-# This helps to understand patterns related to time—whether certain products sell more on specific
-# days or hours.
-
-sales_by_weekday = df.groupby('weekday_name')[['m01ab', 'm01ae', 'n02ba']].sum()
-
-# Plotting sales by weekday
-sales_by_weekday.plot(kind='bar', figsize=(10, 6))
-plt.title('Sales by Weekday', fontsize=16)
-plt.xlabel('Weekday')
-plt.ylabel('Total Sales')
-plt.xticks(rotation=45)
-plt.show()
-
-# Step 4: Sales by Hour (How sales change during the day)
-sales_by_hour = df.groupby('hour')[['m01ab', 'm01ae', 'n02ba']].sum()
-
-# Plotting sales by hour
-sales_by_hour.plot(kind='line', figsize=(10, 6))
-plt.title('Sales by Hour of the Day', fontsize=16)
-plt.xlabel('Hour of the Day')
-plt.ylabel('Total Sales')
-plt.show()
-
-# Step 5: Identifying Top 10 Sales Spikes/Dips
-# I’ll identify the days with the highest and lowest sales.
-# This can be valuable for understanding peak sales periods and why certain days
-# ee large fluctuations in sales.
-# Selecting only 'datum', 'm01ab', and 'm01ae' columns from df
-# Then setting 'datum' as the index (row labels)
-# This makes it easier to find sales by date and sort by sales values
-#
-# Example before:
-#   index  datum       m01ab  m01ae
-#   0      2020-01-01  100    200
-#   1      2020-01-02  150    180
-#
-# After setting index:
-#            m01ab  m01ae
-# datum                 
-# 2020-01-01  100    200
-# 2020-01-02  150    180
-#
-# This helps us find days with biggest sales spikes or dips easily.
-
-sales_spikes_dips = df[['datum', 'm01ab', 'm01ae']].set_index('datum')
-
-# Sorting and picking top 10 sales spikes and dips for M01AB
-# Now, I want to find the days when the product M01AB had the biggest drops in sales,
-# meaning the days with the lowest sales numbers.
-# To do this, I sort the sales data by the 'm01ab' column.
-# Notice I did NOT write 'ascending=True' here.
-# That’s because in pandas, if i don't specify ascending = TRUE OR FALSE then, 
-# it automatically sorts in ascending order by default (from smallest to largest).
-# So, this line sorts the sales from the lowest to the highest,
-# and then .head(10) picks the first 10 rows, which means the 10 days with the lowest sales.
-# This helps me find the sales dips to understand when the product was selling poorly.
-
-top_10_spikes = sales_spikes_dips.sort_values(by='m01ab', ascending=False).head(10)
-top_10_dips = sales_spikes_dips.sort_values(by='m01ab').head(10)
-
-# Displaying the top 10 sales spikes and dips
-print("Top 10 Sales Spikes (M01AB):")
-print(top_10_spikes)
-
-print("\nTop 10 Sales Dips (M01AB):")
-print(top_10_dips)
+from anomaly_detector import detect_anomalies
+from backends import get_backend
+from chart_output import OUTPUT_DIR, finish_chart
+from correlation_stats import CORRELATION_STATS_PATH, heatmap_matrix, load_correlation_stats
+from downsample import plot_series
+from lead_lag import MAX_LAG, best_lags, daily_series, noise_level
+from pipeline import AGGREGATES_DIR, read_aggregate
+from rolling_engine import DEFAULT_WINDOWS, daily_matrix, rolling_means
+from sales_cube import CUBE_PATH, cube_product_columns, load_cube, rollup
+from sales_store import CLEAN_CSV_PATH, discover_products, load_sales
+from seasonal_decomposition import load_decomposition
+from top_k import spikes_and_dips, top_k_rows
+
+# The products I compare with each other in Step 1 are all the product columns of the
+# cleaned data (see discover_products() in sales_store.py), not a hand-typed list.
+# The moving averages, the seasons and the weekday/hour charts follow a few products by
+# name. These are the ones I look at in our own catalog:
+featured_names = ['m01ab', 'm01ae', 'n02ba']
+
+
+# featured_products() picks 'count' products for those charts: the ones from
+# featured_names that the data has, topped up with the best sellers (the cube has every
+# product's totals), so the charts still work on a catalog without our ATC codes, like
+# the fake data from synthetic_sales_data.py.
+
+def featured_products(count, cube=None):
+    cube = load_cube() if cube is None else cube
+    products = cube_product_columns(cube)
+    chosen = [product for product in featured_names if product in products][:count]
+    best_sellers = cube[products].sum().sort_values(ascending=False).index
+    return chosen + [product for product in best_sellers if product not in chosen][:count - len(chosen)]
+
+
+def product_names(products):
+    return ' and '.join(product.upper() for product in products)
+
+# Every chart below is in its own function, so render_all.py can also draw them one by one
+# in separate processes without a screen. Each function loads only the data it needs
+# (that's quick now, see sales_store.py and sales_cube.py), saves the chart to 'path' and
+# only shows it on screen when show=True.
+
+
+def plot_correlation_matrix(path, show=False):
+    # Step 1: Correlation Between Products
+    # I’ll check how different products are correlated with each other to see if there's a relationship
+    # in sales.
+    # This is useful for understanding if the sales of one product are linked with another.
+    # Step 1: Correlation Between Products
+    #
+    # In this step, I want to understand if the sales of different products
+    # are related to each other. To do this, I am calculating the *correlation*
+    # between products.
+    #
+    # What does correlation mean? Basically, it tells me how much two things
+    # move together. The value goes from -1 to +1:
+    #
+    # +1 means they move exactly the same (strong positive link).
+    #  0 means there is no connection between them.
+    # -1 means they move in the opposite direction (strong negative link).
+    #
+    # For example:
+    # If M01AB and M01AE both go up and down at the same time,
+    # their correlation might be around 0.90 or even higher.
+    #
+    # But if M01AB goes up and M01AE goes down, the correlation will be
+    # negative, like -0.5.
+    #
+    # If there’s no pattern at all between them, the correlation will be close to 0.
+    #
+    # Why am I doing this?
+    # It helps me find out if customers are buying some products together.
+    #
+    # For example, maybe when people buy painkillers (like N02BA),
+    # they also buy cough medicines (like R03).
+    #
+    # That would be useful to know for making marketing plans or
+    # product bundles.
+    #
+    # Now I’m going to select the product columns I want to check,
+    # and then use the .corr() function to create a correlation matrix.
+    #
+    # Instead of running .corr() over every row again, I ask the correlation stats that
+    # analysis.py keeps up to date while cleaning (see correlation_stats.py). They give the
+    # same matrix as df[product_columns].corr(), but only need updating with new rows.
+
+    # With hundreds of products, heatmap_matrix() keeps the best sellers in clustered
+    # order, so the heatmap stays readable.
+
+    correlation_matrix = heatmap_matrix(load_correlation_stats(), discover_products())
+
+    # Visualize the correlation matrix using a heatmap
+
+    # Now I want to **visualize** the correlation matrix I created.
+    #
+    # I’m using a heatmap for this, which is basically a colored table
+    # that shows how strongly the products are related to each other.
+    #
+    # Dark red means strong positive correlation (closer to +1).
+    # Dark blue means strong negative correlation (closer to -1).
+    # White or light shades mean weak or no correlation (close to 0).
+    #
+    # I’m using seaborn’s heatmap() function to do this.
+    #
+    # figsize=(10, 8) makes the plot bigger so it’s easier to read.
+    #
+    # annot=True means the actual numbers (like 0.92, -0.35) will show up
+    # inside the boxes.if annot = False then there will be only colour inside
+    # the chart no values.
+    #
+    # cmap='coolwarm' sets the color scheme — warm colors for positive,
+    # cool colors for negative.
+    #
+    # fmt='.2f' means round the numbers to 2 decimal places.
+    #
+    # cbar=True adds the color scale bar on the side so I can see
+    # what the colors mean.with cbar = False there will be no
+    # colour bar at the side of the chart for me to view and know
+    # what each colour means.
+    #
+    # Finally, I added a title to explain what the chart is showing.
+    # finish_chart() saves the chart and, with show=True, displays it.
+
+    plt.figure(figsize=(10, 8))
+    sns.heatmap(correlation_matrix, annot=len(correlation_matrix) <= 12, cmap='coolwarm', fmt='.2f', cbar=True)
+    plt.title('Correlation Between Products', fontsize=16)
+    finish_chart(path, show)
+
+
+def plot_lead_lag(path, show=False):
+    # Step 1b: Correlation with a delay
+    # The heatmap above only compares sales on the same day. Customers might buy R03 first
+    # and N02BA a few days later, so best_lags() from lead_lag.py compares every pair of
+    # products at every delay up to 90 days either way (using FFTs, so all the delays of a
+    # pair cost about as much as one) and keeps the delay where they match best.
+    # It uses what's left after taking out the trend and the weekly and yearly patterns
+    # (see seasonal_decomposition.py), otherwise the weekly rhythm every product shares
+    # would make every pair line up at 0, 7, 14... days.
+    #
+    # The same products as in the correlation heatmap, in the same order.
+    products = list(heatmap_matrix(load_correlation_stats(), discover_products()).index)
+    residuals = daily_series(products)
+    best_lag, best_corr, _ = best_lags(residuals)
+
+    # Every square shows the best delay in days. A positive number means the column
+    # product leads: the row product's sales follow it that many days later.
+    # Pairs whose best correlation is no bigger than chance (noise_level()) are left blank.
+    weak = best_corr.abs() < noise_level(len(residuals))
+    plt.figure(figsize=(10, 8))
+    sns.heatmap(best_lag, mask=weak.to_numpy(), annot=len(best_lag) <= 12, fmt='d', cmap='coolwarm', center=0,
+                vmin=-MAX_LAG, vmax=MAX_LAG, cbar_kws={'label': 'best lag (days)'})
+    plt.title('Best Lead/Lag Between Products (days, positive = column leads)', fontsize=14)
+    finish_chart(path, show)
+
+
+# moving_average_tables() works out what plot_moving_averages() draws when there are no
+# pipeline aggregates to read: the daily sales of the two products and their 30-day
+# rolling averages.
+
+def moving_average_tables(products):
+    # Load the cleaned dataset (typed, through the shared loader in sales_store.py).
+    # This chart only needs the dates and the two products it draws.
+    df = load_sales(columns=['datum'] + products)
+
+    # Step 2: Moving Averages & Seasonality
+    # To observe seasonality in the data, I will calculate a moving average for the sales of a few products.
+    # This helps in smoothing out fluctuations and identifying clear patterns over time.
+    # Now I’m going to calculate the moving average for product M01AB.
+    #
+    # I use .rolling(window=30) to create a 30-day moving window.
+    # This means it will look at the last 30 rows (30 days of sales).
+    #
+    # Then I use .mean() to get the average of those 30 days.
+    #
+    # So instead of just showing one day’s sales,
+    # it shows the average sales from the past 30 days.
+    #
+    # This helps smooth out any daily ups and downs in the data.
+    #
+    # The result is stored in a new column called 'm01ab_rolling_avg'.
+    #
+    # I do the same for M01AE — calculating its 30-day moving average
+    # and saving it in a column called 'm01ae_rolling_avg'.
+    #
+    # These rolling averages will help me see the sales trend
+    # more clearly when I plot them.
+    # I'm calculating a 30-day rolling average for product sales.
+    # This helps smooth out daily "noise" — random ups and downs in sales.
+    # For example, sales may jump from 200 to 120 to 300 in three days.
+    # That doesn’t mean a real trend — it’s just noise (like weather or discounts).
+    # So I use a 30-day window to get a clearer pattern.
+    # How it works:
+    # - First it averages sales from Day 1 to Day 30.
+    # - Then Day 2 to Day 31, then Day 3 to Day 32, and so on.
+    # This rolling average is useful to reveal real trends (like seasonality or growth).
+
+    #
+    # Instead of calling .rolling(window=30).mean() once per product, I use rolling_means()
+    # from rolling_engine.py. It works out the rolling averages for every product I give it
+    # (and for the 7/30/90/365-day windows) in one go from a running total, and I pick out
+    # the 30-day ones for the two products here.
+    # daily_matrix() first gives me one row per date, with every product as a column.
+
+    daily_sales = daily_matrix(df, products)
+    rolling_averages = rolling_means(daily_sales, windows=DEFAULT_WINDOWS)
+    return daily_sales, rolling_averages[30]
+
+
+def plot_moving_averages(path, show=False):
+    # When pipeline.py ran, its aggregate stage already has the daily sales and the 30-day
+    # rolling averages of every product, so I only read those two tables.
+    products = featured_products(2)
+    daily_sales = read_aggregate('daily_sales.csv', products, index_col='datum')
+    rolling_30 = read_aggregate('rolling_30.csv', products, index_col='datum')
+    if daily_sales is None or rolling_30 is None:
+        daily_sales, rolling_30 = moving_average_tables(products)
+    daily_sales = daily_sales[products].copy()
+
+    # for every product its 30-day moving average, next to its daily sales
+    for product in products:
+        daily_sales[f'{product}_rolling_avg'] = rolling_30[product]
+
+    # First, I'm creating a new figure for the plot and setting its size.
+    # This makes sure the chart is wide enough to clearly see the lines.
+
+    plt.figure(figsize=(12, 6))
+
+    # With years of data there are far more points than the chart is pixels wide, so every
+    # line goes through plot_series() from downsample.py instead of plt.plot(). It keeps
+    # about one point per pixel: the lowest and highest day of every pixel column for the
+    # jumpy daily sales (method='minmax', so no spike or dip gets lost), and the points
+    # that shape the line most for the smooth rolling averages (method='lttb').
+    ax = plt.gca()
+
+    for product in products:
+        # This line plots the **original daily sales** of the product
+        # It uses the dates (the index of daily_sales) for the x-axis and the product's sales for the y-axis.
+        # The line will look a bit jagged(rough/uneven) because it's showing the actual ups and downs every day.
+        # The 'alpha=0.7' makes the line a little bit transparent so overlapping lines are easier to see.
+
+        plot_series(ax, daily_sales.index, daily_sales[product], method='minmax', label=f'{product.upper()} Sales',
+                    alpha=0.7)
+
+        # This line plots the **30-day rolling average** of the same product
+        # It's a smoother version of the original sales line, showing the trend over time.
+        # The 'linestyle="--"' makes it a dashed line so i can easily tell it apart from the original sales line
+
+        plot_series(ax, daily_sales.index, daily_sales[f'{product}_rolling_avg'], method='lttb',
+                    label=f'{product.upper()} Rolling Avg', linestyle='--')
+
+    # Setting the title of the chart so it's clear what the plot is about.
+
+    plt.title(f'Sales & Moving Averages of {product_names(products)}', fontsize=16)
+
+    # Labeling the x-axis to show that it represents dates.
+
+    plt.xlabel('Date')
+
+    # Labeling the y-axis to show that it represents sales numbers.
+
+    plt.ylabel('Sales')
+
+    # 🧭 Adding a legend so viewers know which line is which.
+    plt.legend()
+
+    # 👀 Finally, saving the plot and showing it on screen.
+    finish_chart(path, show)
+
+
+def plot_seasonal_decomposition(path, show=False):
+    # Step 2b: Seasonality without guessing
+    # The moving average above still leaves it to my eyes to tell the trend from the
+    # seasons. load_decomposition() from seasonal_decomposition.py splits every product's
+    # daily sales into trend + weekly pattern + yearly pattern + residual (the leftover
+    # noise). It does all products in one batch and keeps the results in a cache, so after
+    # the first run only products with new data are worked out again.
+    products = featured_products(2)
+    decomposition = load_decomposition(products)
+
+    # One row of charts per part: the sales with their trend on top, then the weekly
+    # pattern (only one week is needed, it repeats), the yearly pattern and the residual.
+    fig, axes = plt.subplots(4, 1, figsize=(12, 12))
+    trend = decomposition['trend']
+    observed = trend + decomposition['weekly'] + decomposition['yearly'] + decomposition['residual']
+    for product in products:
+        plot_series(axes[0], observed.index, observed[product], method='minmax', alpha=0.4,
+                    label=f'{product.upper()} Sales')
+        plot_series(axes[0], trend.index, trend[product], method='lttb', label=f'{product.upper()} Trend')
+
+        weekly = decomposition['weekly'][product].groupby(trend.index.dayofweek).first()
+        axes[1].plot(['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'], weekly.to_numpy(), marker='o',
+                     label=product.upper())
+
+        yearly = decomposition['yearly'][product].groupby(trend.index.dayofyear).first()
+        axes[2].plot(yearly.index, yearly.to_numpy(), label=product.upper())
+
+        plot_series(axes[3], trend.index, decomposition['residual'][product], method='minmax', alpha=0.7,
+                    label=product.upper())
+
+    titles = ['Sales & Trend', 'Weekly Pattern', 'Yearly Pattern (day of the year)', 'Residual']
+    for ax, title in zip(axes, titles):
+        ax.set_title(title)
+        ax.legend()
+    axes[2].set_xlabel('Day of the Year')
+    fig.suptitle(f'Seasonal Decomposition of {product_names(products)}', fontsize=16)
+    plt.tight_layout()
+    finish_chart(path, show)
+
+
+def plot_sales_by_weekday(path, show=False):
+    # Load the aggregation cube (see sales_cube.py) for the weekday totals.
+    cube = load_cube()
+
+    # Step 3: Sales by Weekday & Hour
+    # I’ll analyze how sales change depending on the day of the week and hour of the day.
+    # This helps to understand patterns related to time—whether certain products sell more on specific
+    # days or hours.
+
+    products = featured_products(3, cube)
+    sales_by_weekday = rollup(cube, ['weekday_name'], products)[products]
+
+    # Plotting sales by weekday
+    sales_by_weekday.plot(kind='bar', figsize=(10, 6))
+    plt.title('Sales by Weekday', fontsize=16)
+    plt.xlabel('Weekday')
+    plt.ylabel('Total Sales')
+    plt.xticks(rotation=45)
+    finish_chart(path, show)
+
+
+def plot_sales_by_hour(path, show=False):
+    # Load the aggregation cube (see sales_cube.py) for the hourly totals.
+    cube = load_cube()
+
+    # Step 4: Sales by Hour (How sales change during the day)
+    products = featured_products(3, cube)
+    sales_by_hour = rollup(cube, ['hour'], products)[products]
+
+    # Plotting sales by hour
+    sales_by_hour.plot(kind='line', figsize=(10, 6))
+    plt.title('Sales by Hour of the Day', fontsize=16)
+    plt.xlabel('Hour of the Day')
+    plt.ylabel('Total Sales')
+    finish_chart(path, show)
+
+
+# start/end limit the spikes and dips to a period (for example start='2019-01-01'); only
+# the months in that period are read from the store.
+def print_spikes_and_dips(start=None, end=None):
+    # The sales per date (every product plus 'total_sales') come from the aggregation
+    # backend in backends.py: pandas by default, Polars or DuckDB with SALES_BACKEND.
+    product_columns = discover_products()
+    daily = get_backend().daily_totals(product_columns, start, end)
+
+    # Step 5: Identifying Top 10 Sales Spikes/Dips
+    # I’ll identify the days with the highest and lowest sales.
+    # This can be valuable for understanding peak sales periods and why certain days
+    # ee large fluctuations in sales.
+    # Selecting only 'datum', 'm01ab', and 'm01ae' columns from df
+    # Then setting 'datum' as the index (row labels)
+    # This makes it easier to find sales by date and sort by sales values
+    #
+    # Example before:
+    #   index  datum       m01ab  m01ae
+    #   0      2020-01-01  100    200
+    #   1      2020-01-02  150    180
+    #
+    # After setting index:
+    #            m01ab  m01ae
+    # datum                 
+    # 2020-01-01  100    200
+    # 2020-01-02  150    180
+    #
+    # This helps us find days with biggest sales spikes or dips easily.
+
+    #
+    # daily_totals() already has 'datum' as its index, so I only pick the two columns
+    # (M01AB and M01AE in our catalog, see featured_products()).
+
+    products = featured_products(2)
+    product = products[0]
+    sales_spikes_dips = daily[products]
+
+    # Sorting and picking top 10 sales spikes and dips for M01AB
+    # Now, I want to find the days when the product M01AB had the biggest drops in sales,
+    # meaning the days with the lowest sales numbers.
+    # To do this, I sort the sales data by the 'm01ab' column.
+    # Notice I did NOT write 'ascending=True' here.
+    # That’s because in pandas, if i don't specify ascending = TRUE OR FALSE then, 
+    # it automatically sorts in ascending order by default (from smallest to largest).
+    # So, this line sorts the sales from the lowest to the highest,
+    # and then .head(10) picks the first 10 rows, which means the 10 days with the lowest sales.
+    # This helps me find the sales dips to understand when the product was selling poorly.
+
+    #
+    # Sorting the whole table twice only to keep 10 rows each time is wasted work, so I use
+    # top_k_rows() from top_k.py. It finds the same 10 rows in one pass over the column
+    # (np.partition) and only sorts those 10.
+
+    top_10_spikes = top_k_rows(sales_spikes_dips, product, k=10, largest=True)
+    top_10_dips = top_k_rows(sales_spikes_dips, product, k=10, largest=False)
+
+    # Displaying the top 10 sales spikes and dips
+    print(f"Top 10 Sales Spikes ({product.upper()}):")
+    print(top_10_spikes)
+
+    print(f"\nTop 10 Sales Dips ({product.upper()}):")
+    print(top_10_dips)
+
+    # The same question for every product (and for all products together) in one go, split
+    # by year, so a record day in 2014 doesn't hide the best days of later years.
+    # spikes_and_dips() answers it with one selection pass per year.
+
+    all_products = daily
+    yearly_spikes, yearly_dips = spikes_and_dips(all_products, all_products.columns, k=3, by=all_products.index.year)
+
+    print("\nTop 3 Sales Spikes per Year (all products):")
+    print(yearly_spikes.pivot_table(index=['period', 'rank'], columns='product', values='sales'))
+
+    # The biggest days of all time are mostly the busy season, and a strange day in a
+    # quiet month never shows up in them. detect_anomalies() from anomaly_detector.py goes
+    # through the days in order and compares every product's sales with the same weekday
+    # in the 8 weeks before (robust z-score: distance from the median in MADs). It is the
+    # same check analysis.py runs on every new day while it cleans.
+
+    anomalies = detect_anomalies(daily[product_columns])
+    anomalies['size'] = anomalies['robust_z'].abs()
+
+    print("\nAnomalies per product (sales far from the same weekday in the weeks before):")
+    print(anomalies.pivot_table(index='product', columns='kind', values='sales', aggfunc='count', fill_value=0))
+
+    print(f"\nStrongest 10 Anomalies ({product.upper()}):")
+    print(anomalies[anomalies['product'] == product].nlargest(10, 'size').drop(columns='size').to_string(index=False))
+
+
+# The charts this file makes, the file name each one is saved under in 04_outputs/, and
+# the data files it reads (render_all.py only draws a chart again when those changed).
+CHARTS = [
+    ('advanced_product_correlation.png', plot_correlation_matrix, [CORRELATION_STATS_PATH]),
+    ('lead_lag_heatmap.png', plot_lead_lag, [CLEAN_CSV_PATH, CORRELATION_STATS_PATH]),
+    ('moving_averages_m01ab_m01ae.png', plot_moving_averages,
+     [CLEAN_CSV_PATH] + [os.path.join(AGGREGATES_DIR, name) for name in ('daily_sales.csv', 'rolling_30.csv')]),
+    ('seasonal_decomposition_m01ab_m01ae.png', plot_seasonal_decomposition, [CLEAN_CSV_PATH]),
+    ('advanced_sales_by_weekday.png', plot_sales_by_weekday, [CUBE_PATH]),
+    ('advanced_sales_by_hour.png', plot_sales_by_hour, [CUBE_PATH]),
+]
+
+
+if __name__ == '__main__':
+    for filename, plot_chart, _ in CHARTS:
+        plot_chart(os.path.join(OUTPUT_DIR, filename), show=True)
+    print_spikes_and_dips()
 
 
 # -------------------- FINAL NOTE --------------------
 # This code explores sales trends for pharma products.
 # It covers:
 # - Correlation between products
+# - Lead/lag between products (which product's sales follow another's, and how many days later)
 # - Moving averages to show trends
+# - Trend / weekly / yearly split of the sales (seasonal decomposition)
 # - Sales patterns by weekday/hour
 # - Top 10 sales spikes & dips
+# - Unusual days compared to the same weekday in the weeks before (anomalies)
 
 # Purpose:
 # To find patterns, spot seasonality, and understand product behavior over time.
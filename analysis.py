@@ -1,7 +1,31 @@
 # Importing the essential library to work with data
 
+import argparse
+import io
+import json
+import os
+
+import numpy as np
 import pandas as pd
 
+from anomaly_detector import AnomalyDetector, combine_events, write_anomalies
+from correlation_stats import CorrelationStats
+from date_parsing import DateParser
+from instrumentation import enable_tracing, traced, traced_chunks
+from sales_cube import build_cube, load_cube, merge_cubes, save_cube
+from sales_store import clear_typed_store, product_columns_in, write_typed_part
+from validation import count_reasons, find_problems, rejected_rows, write_rejected
+
+# These are the file paths I use for the raw data and the cleaned output.
+RAW_PATH = 'sales_data.csv'
+CLEAN_PATH = '02_data_clean/sales_data_clean.csv'
+
+# These are the columns that describe *when* a sale happened. Every other column in
+# the raw file is a product column with sales volumes.
+RAW_CALENDAR_COLUMNS = ['datum', 'Year', 'Month', 'Hour', 'Weekday Name']
+RAW_INTEGER_COLUMNS = ['Year', 'Month', 'Hour']
+
+
 # Load the raw sales dataset
 # I'm loading the raw sales data from a CSV file (sales_data.csv) into a DataFrame
 # called df. This will allow me to manipulate and clean the data.
@@ -10,8 +34,80 @@ import pandas as pd
 # 'df' is the variable I have created here.
 # Now, by doing pd.read_csv('sales_data.csv'), I have loaded the dataset that I
 # downloaded from Kaggle, and it has been converted into a dataset using pandas.
+#
+# Our hourly exports can be several GB, so loading the whole file at once runs out of
+# memory. When I pass a chunksize, read_csv gives me the file piece by piece instead,
+# and the rest of the pipeline only ever holds one chunk in memory.
+# I read the header first so I can force every product column to float. Otherwise a
+# chunk where a product only has whole numbers would come back as int, and the same
+# row would look different from one chunk to the next.
+#
+# I also keep track of *where in the file* (in bytes) the data starts and ends, so the
+# incremental mode below can carry on from where the last run stopped. I only ever
+# read up to the last complete line: if the nightly export is still writing a line
+# when I run, that half-written line is left for the next run.
+
+def read_raw_header(path=RAW_PATH):
+    with open(path, 'rb') as raw_file:
+        first_line = raw_file.readline()
+    header = list(pd.read_csv(io.BytesIO(first_line), nrows=0).columns)
+    return header, len(first_line)
+
+
+def complete_lines_end(path):
+    with open(path, 'rb') as raw_file:
+        end = raw_file.seek(0, os.SEEK_END)
+        while end > 0:
+            block_start = max(0, end - 65536)
+            raw_file.seek(block_start)
+            block = raw_file.read(end - block_start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return block_start + newline + 1
+            end = block_start
+    return 0
+
+
+# ByteRange lets read_csv read just one stretch of the raw file (from 'start' to 'end'
+# bytes) without me loading that stretch into memory first.
+
+class ByteRange(io.RawIOBase):
+    def __init__(self, path, start, end):
+        self.raw_file = open(path, 'rb')
+        self.raw_file.seek(start)
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self.remaining)
+        data = self.raw_file.read(size)
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self.raw_file.close()
+        super().close()
+
+
+def read_raw_chunks(path=RAW_PATH, chunksize=None, start=None, end=None):
+    header, data_start = read_raw_header(path)
+    start = data_start if start is None else start
+    end = complete_lines_end(path) if end is None else end
+    if end <= start:
+        return []
+    dtypes = {column: 'float64' for column in header if column not in RAW_CALENDAR_COLUMNS}
+    source = io.BufferedReader(ByteRange(path, start, end))
+    if chunksize is None:
+        # Without a chunksize I still only read when the loop asks for the (single)
+        # chunk, so the trace can time read_csv the same way in both modes.
+        chunks = (pd.read_csv(source, header=None, names=header, dtype=dtypes) for _ in range(1))
+    else:
+        chunks = pd.read_csv(source, header=None, names=header, dtype=dtypes, chunksize=chunksize)
+    return traced_chunks('read_csv', chunks)
 
-df = pd.read_csv('sales_data.csv')
 
 # Step 1: Handle missing values
 # First, I’ll check if there are any missing values in the dataset.
@@ -20,11 +116,7 @@ df = pd.read_csv('sales_data.csv')
 # values as FALSE when ill give command to sum them thats how it will sum them true = 1 , false = 0.
 # By doing df.isnull().sum(),it will tell me the total count of missing values in
 # the entire dataset.
-
-missing_values = df.isnull().sum()
-print("Missing values in each column:")
-print(missing_values)
-
+#
 # Dropping rows with missing values
 # By using df.dropna(), all the rows with empty values will be dropped and will not
 # be part of the dataset for analysis.
@@ -42,16 +134,45 @@ print(missing_values)
 # Removing these rows won't significantly impact the analysis or lead to biased results.
 # If more than 5% of the rows in the dataset had missing values, I would have considered
 # alternative methods like filling missing values.
-
-df = df.dropna()  
-
+#
+# Once the empty rows are gone, Year/Month/Hour can go back to being whole numbers
+# (pandas turns them into floats in any chunk that had a NaN in them).
+#
 # Step 2: Correct data types
 # The 'datum' column should be in a date format, so I'll convert it to a datetime object.
 # Over here, the df has my original dataset's date column under the 'datum' column.
 # By running pd.to_datetime(df['datum']), the dates under the 'datum' column get
 # formatted into a format that pandas can read.
+#
+# I don't call pd.to_datetime() without a format anymore, because then pandas guesses
+# the format row by row and that was the slowest step on big files. The DateParser
+# from date_parsing.py works out the format once, parses each distinct date only once,
+# and tells me which rows had a date it couldn't read. I drop those rows here and the
+# parser keeps count of them, so I can report them at the end.
+#
+# Steps 1 and 2 together: validate_rows()
+# Empty values and unreadable dates aren't the only broken rows. find_problems() from
+# validation.py also catches negative sales and Year / Month / Weekday Name values that
+# don't agree with 'datum', checking whole columns at once, and gives every row a
+# reason code (0 = fine). The rows with a problem are dropped from the clean data and
+# returned separately, unchanged and with their reason code, so clean_sales_data() can
+# write them to sales_data_rejected.csv instead of losing them without a trace.
+
+def validate_rows(df, date_parser):
+    with traced('to_datetime', rows_in=len(df)):
+        dates, bad_dates = date_parser.parse(df['datum'])
+    with traced('validate', rows_in=len(df)) as step:
+        products = [column for column in df.columns if column not in RAW_CALENDAR_COLUMNS]
+        reasons = find_problems(df, dates, bad_dates, products)
+        good = reasons == 0
+        rejected = rejected_rows(df[~good], reasons[~good])
+        df = df[good].copy()
+        df['datum'] = dates[good]
+        integer_columns = [column for column in RAW_INTEGER_COLUMNS if column in df.columns]
+        df = df.astype({column: 'int64' for column in integer_columns})
+        step.rows_out = len(df)
+    return df, rejected
 
-df['datum'] = pd.to_datetime(df['datum'])
 
 # Step 3: Remove duplicates
 # I want to make sure there are no duplicate rows, so I’ll clean them up.
@@ -60,8 +181,67 @@ df['datum'] = pd.to_datetime(df['datum'])
 # I do this for accurate analysis. The other duplicate rows might have been mistakenly
 # created, so I removed them to make sure that each row in my dataset represents unique
 # data.
+#
+# When I clean the file in chunks, df.drop_duplicates() only sees one chunk, so a row
+# that repeats a row from an earlier chunk would slip through. To stop that, I turn
+# every row into a 64-bit fingerprint (a hash of all its values) and remember the
+# fingerprints I've already written. That costs 8 bytes per unique row, which is far
+# smaller than keeping the rows themselves. Two different rows getting the same 64-bit
+# fingerprint is astronomically unlikely at our data sizes.
+#
+# The fingerprints are kept as a short list of sorted arrays ("runs"), so checking a
+# chunk is a binary search per row in every run (np.searchsorted). Slotting a chunk's
+# new fingerprints into one big sorted array would copy the whole history for every
+# chunk, so instead every chunk adds a run of its own, and two runs are only merged when
+# the newer one has grown to at least half the size of the one before it. The runs get
+# smaller towards the end of the list, so there are never more than about log2(rows)
+# of them, and every fingerprint is copied about log2(rows) times in total instead of
+# once per chunk that comes after it.
+
+def row_digests(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def seen_in(sorted_digests, digests):
+    if len(sorted_digests) == 0:
+        return np.zeros(len(digests), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_digests, digests), len(sorted_digests) - 1)
+    return sorted_digests[positions] == digests
+
+
+def merge_sorted(larger, smaller):
+    return np.insert(larger, np.searchsorted(larger, smaller), smaller)
+
+
+def add_digest_run(runs, new_digests):
+    if len(new_digests) == 0:
+        return runs
+    runs = runs + [np.sort(new_digests)]
+    while len(runs) > 1 and 2 * len(runs[-1]) >= len(runs[-2]):
+        newer = runs.pop()
+        runs.append(merge_sorted(runs.pop(), newer))
+    return runs
+
+
+# merge_digest_runs() turns the runs into the one sorted array that gets saved.
+
+def merge_digest_runs(runs):
+    merged = np.empty(0, dtype=np.uint64)
+    for run in reversed(runs):
+        merged = merge_sorted(run, merged)
+    return merged
+
+
+def drop_duplicates_across_chunks(df, seen_runs):
+    with traced('drop_duplicates', rows_in=len(df)) as step:
+        digests = row_digests(df)
+        keep = ~pd.Series(digests).duplicated().to_numpy()
+        for run in seen_runs:
+            keep &= ~seen_in(run, digests)
+        seen_runs = add_digest_run(seen_runs, digests[keep])
+        step.rows_out = int(keep.sum())
+    return df[keep], seen_runs
 
-df = df.drop_duplicates()
 
 # Step 4: Standardize Column Names
 # I’ll clean up the column names to make them easier to work with by making them
@@ -71,7 +251,11 @@ df = df.drop_duplicates()
 # Similarly, I replace the empty space between words with underscores to avoid any
 # errors, as pandas reads them with underscores more easily.
 
-df.columns = df.columns.str.lower().str.replace(' ', '_')
+def standardize_columns(df):
+    df = df.copy()
+    df.columns = df.columns.str.lower().str.replace(' ', '_')
+    return df
+
 
 # Save the cleaned data to a new file
 # I’ll save the cleaned dataset into a new file so I don’t overwrite the original one.
@@ -83,11 +267,234 @@ df.columns = df.columns.str.lower().str.replace(' ', '_')
 # I have set index=False because pandas, by default, keeps it as TRUE.
 # By setting it to False, my dataset will be stored as it is after being cleaned.
 # Otherwise, pandas would assign row numbers starting from 0 to 2000. I didn’t want that.
+#
+# In chunked mode I write the first chunk with the header and then keep appending the
+# next chunks underneath it, so the cleaned file grows piece by piece on disk.
+# Every chunk is also written as a typed Arrow part (see sales_store.py), which is
+# what the analysis scripts load instead of re-parsing the CSV.
+# While the chunk is in memory I also add it to the aggregation cube (see sales_cube.py),
+# so the charts can get their monthly/weekday/hour totals without touching the rows,
+# and to the correlation stats (see correlation_stats.py) behind the correlation heatmaps.
+#
+# clean_sales_data() runs the four steps above on every chunk. With chunksize=None it
+# reads the whole file in one go (the original behaviour); with a chunksize, the
+# biggest thing in memory is one chunk plus the fingerprint array.
+#
+# Incremental mode
+# New days get added to the end of sales_data.csv every night. Re-cleaning six years of
+# history just for that is wasteful, so after every run I save a small state file
+# (clean_state.json) with a "watermark": how many bytes of the raw file I've already
+# cleaned and the last date I saw. I also save the row fingerprints from Step 3
+# (clean_digests.npy). With incremental=True I skip straight to the bytes after the
+# watermark, clean only those new rows, drop any that repeat a row I've already kept,
+# and append them to the clean CSV, the Arrow parts and the cube.
+# If there's no state yet, or the raw file got shorter (so it was replaced rather than
+# appended to), I fall back to cleaning everything from scratch.
+#
+# While the chunks go by, the daily totals are also handed to the anomaly detector
+# (anomaly_detector.py), which compares every new day with the same weekday in the weeks
+# before. Its state is saved next to the other state files, so every incremental run
+# reports the unusual days among the new data straight away. The last day of the file
+# is only judged once a later day shows up, because more rows for it can still come.
+
+def clean_output_paths(clean_path=CLEAN_PATH):
+    folder = os.path.dirname(clean_path)
+    return {
+        'csv': clean_path,
+        'typed': os.path.splitext(clean_path)[0] + '.arrow',
+        'cube': os.path.join(folder, 'sales_cube.csv'),
+        'state': os.path.join(folder, 'clean_state.json'),
+        'digests': os.path.join(folder, 'clean_digests.npy'),
+        'correlation': os.path.join(folder, 'correlation_stats.npz'),
+        'rejected': os.path.join(folder, 'sales_data_rejected.csv'),
+        'anomaly_state': os.path.join(folder, 'anomaly_state.npz'),
+        'anomalies': os.path.join(folder, 'sales_anomalies.csv'),
+    }
+
+
+def load_clean_state(paths, raw_path):
+    if not all(os.path.exists(paths[name]) for name in ('state', 'digests', 'cube', 'correlation', 'anomaly_state')):
+        return None
+    with open(paths['state']) as state_file:
+        state = json.load(state_file)
+    if state['raw_path'] != os.path.abspath(raw_path) or state['byte_offset'] > os.path.getsize(raw_path):
+        return None
+    # The dedup check needs the saved fingerprints sorted (see drop_duplicates_across_chunks()).
+    # They are saved that way; one cheap pass makes sure of it, so a nightly run only
+    # costs a binary search per new row, not a sort of the whole history.
+    digests = np.load(paths['digests'])
+    if len(digests) > 1 and not (digests[1:] >= digests[:-1]).all():
+        digests = np.sort(digests)
+    state['digests'] = digests
+    return state
+
+
+def save_clean_state(paths, state, digests):
+    np.save(paths['digests'], digests)
+    with open(paths['state'], 'w') as state_file:
+        json.dump(state, state_file, indent=2)
+
+
+def clean_sales_data(raw_path=RAW_PATH, clean_path=CLEAN_PATH, chunksize=None, incremental=False):
+    os.makedirs(os.path.dirname(clean_path) or '.', exist_ok=True)
+    paths = clean_output_paths(clean_path)
+    state = load_clean_state(paths, raw_path) if incremental else None
+    end = complete_lines_end(raw_path)
+
+    if state is None:
+        seen_runs = []
+        date_parser = DateParser()
+        part_number = 0
+        cube = None
+        correlation = None
+        detector = None
+        last_datum = None
+        write_header = True
+        chunks = read_raw_chunks(raw_path, chunksize, end=end)
+        clear_typed_store(paths['typed'])
+    else:
+        seen_runs = [state['digests']]
+        date_parser = DateParser(state['date_format'])
+        part_number = state['next_part']
+        cube = load_cube(paths['cube'])
+        correlation = CorrelationStats.load(paths['correlation'])
+        detector = AnomalyDetector.load(paths['anomaly_state'])
+        last_datum = state['last_datum']
+        write_header = False
+        chunks = read_raw_chunks(raw_path, chunksize, start=state['byte_offset'], end=end)
+
+    watermark = None if last_datum is None else pd.Timestamp(last_datum)
+    missing_values = None
+    preview = None
+    rows_read = 0
+    rows_written = 0
+    late_rows = 0
+    rows_rejected = 0
+    rejected_reasons = count_reasons(np.empty(0, dtype=np.uint8))
+    overwrite_rejected = state is None
+    anomalies = []
+
+    for chunk in chunks:
+        rows_read += len(chunk)
+        chunk_missing = chunk.isnull().sum()
+        missing_values = chunk_missing if missing_values is None else missing_values + chunk_missing
+
+        chunk, rejected = validate_rows(chunk, date_parser)
+        if len(rejected) or overwrite_rejected:
+            write_rejected(rejected, paths['rejected'], overwrite=overwrite_rejected)
+            overwrite_rejected = False
+            rows_rejected += len(rejected)
+            for name, count in count_reasons(rejected['reason_code'].to_numpy()).items():
+                rejected_reasons[name] += count
+        chunk, seen_runs = drop_duplicates_across_chunks(chunk, seen_runs)
+        chunk = standardize_columns(chunk)
+        if len(chunk) == 0:
+            continue
+
+        if watermark is not None:
+            late_rows += int((chunk['datum'] < watermark).sum())
+        chunk_last = chunk['datum'].max()
+        last_datum = chunk_last if last_datum is None else max(pd.Timestamp(last_datum), chunk_last)
+
+        with traced('write_clean', rows_in=len(chunk)):
+            chunk.to_csv(paths['csv'], index=False, mode='w' if write_header else 'a', header=write_header)
+            write_header = False
+            write_typed_part(chunk, part_number, paths['typed'])
+        part_number += 1
+        cube = merge_cubes([cube, build_cube(chunk)])
+        if correlation is None:
+            correlation = CorrelationStats(product_columns_in(chunk.columns))
+        with traced('correlation', rows_in=len(chunk)):
+            correlation.update(chunk)
+        if detector is None:
+            detector = AnomalyDetector(product_columns_in(chunk.columns))
+        with traced('anomalies', rows_in=len(chunk)) as step:
+            daily = chunk.groupby(chunk['datum'].dt.normalize())[detector.products].sum()
+            anomalies.append(detector.ingest(daily))
+            step.rows_out = len(anomalies[-1])
+        if preview is None:
+            preview = chunk.head()
+        rows_written += len(chunk)
+
+    if cube is not None:
+        save_cube(cube, paths['cube'])
+    if correlation is not None:
+        correlation.save(paths['correlation'])
+    if detector is not None:
+        # The last day stays pending: the raw file can still get more rows for it, so it
+        # is judged by the run that sees the next day.
+        detector.save(paths['anomaly_state'])
+    anomalies = combine_events(anomalies)
+    write_anomalies(anomalies, paths['anomalies'], overwrite=state is None)
+    save_clean_state(paths, {
+        'raw_path': os.path.abspath(raw_path),
+        'byte_offset': end,
+        'last_datum': None if last_datum is None else pd.Timestamp(last_datum).isoformat(),
+        'date_format': date_parser.date_format,
+        'next_part': part_number,
+    }, merge_digest_runs(seen_runs))
+
+    return {
+        'incremental': state is not None,
+        'missing_values': missing_values,
+        'preview': preview,
+        'rows_read': rows_read,
+        'rows_written': rows_written,
+        'rows_rejected': rows_rejected,
+        'rejected_reasons': rejected_reasons,
+        'late_rows': late_rows,
+        'anomalies': anomalies,
+        'last_datum': None if last_datum is None else pd.Timestamp(last_datum),
+        'date_format': date_parser.date_format,
+        'bad_date_rows': date_parser.failed_rows,
+        'bad_date_examples': date_parser.failed_examples,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Clean the raw pharmacy sales data.')
+    parser.add_argument('--input', default=RAW_PATH, help='raw sales CSV to clean')
+    parser.add_argument('--output', default=CLEAN_PATH, help='where to write the cleaned CSV')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='rows per chunk; stream the file instead of loading it all at once')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only clean rows added to the raw file since the last run')
+    parser.add_argument('--trace', nargs='?', const='1', default=None, metavar='PATH',
+                        help='record the time and memory of every step as a JSON trace (see instrumentation.py)')
+    args = parser.parse_args()
+    if args.trace:
+        enable_tracing(args.trace)
+
+    result = clean_sales_data(args.input, args.output, args.chunksize, args.incremental)
+    if args.incremental and not result['incremental']:
+        print("No usable state from an earlier run, so I cleaned the whole file.")
+
+    if result['rows_read'] == 0:
+        print("No new rows to clean.")
+    else:
+        print("Missing values in each column:")
+        print(result['missing_values'])
 
-df.to_csv('02_data_clean/sales_data_clean.csv', index=False)
+    # Display the cleaned dataset
+    # Finally, the dataset has been cleaned. Now I am going to display its output.
 
-# Display the cleaned dataset
-# Finally, the dataset has been cleaned. Now I am going to display its output.
+    print(f"\nDates were parsed with the format {result['date_format']}.")
+    if result['bad_date_rows']:
+        print(f"{result['bad_date_rows']} rows had a date that could not be parsed and were dropped,"
+              f" for example: {result['bad_date_examples']}")
 
-print("\nCleaned dataset:")
-print(df.head())
\ No newline at end of file
+    if result['preview'] is not None:
+        print("\nCleaned dataset:")
+        print(result['preview'])
+    print(f"\n{result['rows_written']} of {result['rows_read']} rows kept.")
+    if result['rows_rejected']:
+        reasons = ', '.join(f'{name}: {count}' for name, count in result['rejected_reasons'].items() if count)
+        print(f"{result['rows_rejected']} rows failed validation ({reasons}) and were written to"
+              f" {clean_output_paths(args.output)['rejected']}.")
+    if len(result['anomalies']):
+        print(f"\n{len(result['anomalies'])} anomalies (a product selling far from its usual level for that weekday) were"
+              f" found and added to {clean_output_paths(args.output)['anomalies']}. The latest ones:")
+        print(result['anomalies'].tail(10).to_string(index=False))
+    if result['late_rows']:
+        print(f"{result['late_rows']} new rows are dated before the previous watermark.")
+    print(f"Cleaned data now runs up to {result['last_datum']}.")
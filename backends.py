@@ -0,0 +1,291 @@
+# Where the big aggregations run: pandas, Polars or DuckDB
+#
+# The aggregations the scripts need from the row-level data are always the same few:
+#   totals(by)          sales per product (plus 'total_sales') per month / weekday / hour,
+#                       or over everything with by=[]
+#   daily_totals()      one row per date, every product plus 'total_sales'
+#   correlation()       the correlation matrix of the products
+#   spikes_and_dips()   the top-K best and worst days per product
+# This file answers them through a "backend", and every backend gives back exactly the
+# same pandas tables, so the scripts don't care which one did the work:
+#
+# - pandas (the default): reads the typed store one part at a time and adds the pieces
+#   up (see parallel_groupby.py and correlation_stats.py).
+# - polars: describes the whole query lazily (nothing is read until the end), then lets
+#   Polars' streaming engine run it on all CPU cores in batches, so the data never has
+#   to fit in memory.
+# - duckdb: the same query as SQL in an embedded DuckDB database (no server), which is
+#   also multi-threaded and spills to disk when it runs out of memory.
+#
+# Polars and DuckDB are optional (pip install polars / pip install duckdb). Both read
+# the typed Arrow store (only the months in the date range) or, without it, the clean CSV.
+# From the CSV they read the sales as float32, like read_clean_csv() in sales_store.py
+# does for pandas, so every backend adds up exactly the same numbers.
+# The backend is picked with the SALES_BACKEND environment variable:
+#   SALES_BACKEND=duckdb python advanced_analysis.py
+#
+# Check that a backend gives the same answers as pandas on the current data:
+#   python backends.py --check                    # every installed backend
+#   python backends.py --backend duckdb --by year month
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from correlation_stats import CorrelationStats
+from parallel_groupby import parallel_groupby
+from sales_store import (CLEAN_CSV_PATH, TYPED_STORE_PATH, WEEKDAY_DTYPE, discover_products, iter_sales,
+                         product_columns_in, store_parts, typed_store_available)
+from top_k import spikes_and_dips
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = None
+
+BACKEND_ENV = 'SALES_BACKEND'
+BACKENDS = ('pandas', 'polars', 'duckdb')
+BATCH_ROWS = 100_000
+
+
+# sales_dataset() is the typed store as one pyarrow "dataset": a list of part files
+# that Polars and DuckDB can scan lazily, reading only the columns and rows a query
+# needs. Parts can store a column with different integer sizes (see to_typed_frame() in
+# sales_store.py), so the dataset gets one schema that is wide enough for all of them.
+
+def sales_dataset(start=None, end=None, store_path=TYPED_STORE_PATH):
+    parts = store_parts(store_path, start, end) or store_parts(store_path)[:1]
+    schemas = [pa.ipc.open_file(pa.memory_map(part_path, 'r')).schema for part_path in parts]
+    schema = pa.unify_schemas(schemas, promote_options='permissive')
+    return ds.dataset(parts, schema=schema, format='ipc')
+
+
+# Backend has everything that works the same for every backend. A backend only has to
+# say how to add up products per group (group_sums) and how to hand over the rows in
+# batches (batches).
+# workers is the number of processes the pandas backend groups with (see
+# parallel_groupby(); 0 keeps everything in this process, None uses $SALES_WORKERS or
+# one per CPU core). Polars and DuckDB run their own threads and ignore it.
+
+class Backend:
+    name = None
+
+    def __init__(self, store_path=TYPED_STORE_PATH, csv_path=CLEAN_CSV_PATH, workers=None):
+        self.store_path = store_path
+        self.csv_path = csv_path
+        self.workers = workers
+
+    def products(self, products=None):
+        return discover_products(self.store_path, self.csv_path) if products is None else list(products)
+
+    # totals() has the same shape as rollup() in sales_cube.py: the group columns as the
+    # index (weekdays in Monday-to-Sunday order), one float64 column per product and
+    # 'total_sales'.
+    def totals(self, by, products=None, start=None, end=None):
+        products = self.products(products)
+        sums = self.group_sums(list(by), products, start, end)
+        if by:
+            if 'weekday_name' in by:
+                sums['weekday_name'] = sums['weekday_name'].astype(str).astype(WEEKDAY_DTYPE)
+            sums = sums.set_index(list(by)).sort_index()
+        totals = sums[products].astype('float64')
+        totals['total_sales'] = totals.sum(axis=1)
+        return totals
+
+    def daily_totals(self, products=None, start=None, end=None):
+        totals = self.totals(['datum'], products, start, end)
+        totals.index = pd.DatetimeIndex(totals.index).as_unit('ns')
+        return totals
+
+    # correlation() feeds the rows batch by batch into the same CorrelationStats the
+    # cleaner uses, so only one batch is in memory at a time.
+    def correlation(self, products=None, start=None, end=None):
+        products = self.products(products)
+        stats = CorrelationStats(products)
+        for batch in self.batches(products, start, end):
+            stats.update(batch)
+        return stats.corr(products)
+
+    def spikes_and_dips(self, products=None, k=10, start=None, end=None):
+        daily = self.daily_totals(products, start, end)
+        return spikes_and_dips(daily, daily.columns, k=k)
+
+
+class PandasBackend(Backend):
+    name = 'pandas'
+
+    def group_sums(self, by, products, start, end):
+        if by:
+            sums = parallel_groupby(by, products, ('sum',), self.workers, start, end,
+                                    store_path=self.store_path, csv_path=self.csv_path)
+            return sums.xs('sum', axis=1, level=1).reset_index()
+        total = np.zeros(len(products))
+        for batch in self.batches(products, start, end):
+            total += batch[products].to_numpy(dtype='float64').sum(axis=0)
+        return pd.DataFrame([total], columns=products)
+
+    def batches(self, products, start, end):
+        return iter_sales(products, self.store_path, self.csv_path, BATCH_ROWS, start, end)
+
+
+class PolarsBackend(Backend):
+    name = 'polars'
+
+    def __init__(self, store_path=TYPED_STORE_PATH, csv_path=CLEAN_CSV_PATH, workers=None):
+        super().__init__(store_path, csv_path, workers)
+        import polars
+        self.pl = polars
+
+    # scan() is the lazy query "the rows from start to end, these columns". Nothing is
+    # read yet; Polars reads the data when the finished query is collected.
+    def scan(self, columns, start, end):
+        pl = self.pl
+        if typed_store_available(self.store_path):
+            frame = pl.scan_pyarrow_dataset(sales_dataset(start, end, self.store_path))
+        else:
+            frame = pl.scan_csv(self.csv_path, try_parse_dates=True)
+            products = product_columns_in(frame.collect_schema().names())
+            frame = frame.with_columns([pl.col(product).cast(pl.Float32) for product in products])
+        if start is not None:
+            frame = frame.filter(pl.col('datum') >= pd.Timestamp(start).to_pydatetime())
+        if end is not None:
+            frame = frame.filter(pl.col('datum') <= pd.Timestamp(end).to_pydatetime())
+        return frame.select(list(columns))
+
+    def collect(self, frame):
+        try:
+            return frame.collect(engine='streaming')
+        except TypeError:  # Polars before 1.23 calls it streaming=True
+            return frame.collect(streaming=True)
+
+    def group_sums(self, by, products, start, end):
+        pl = self.pl
+        frame = self.scan(by + products, start, end)
+        sums = [pl.col(product).cast(pl.Float64).sum() for product in products]
+        if by:
+            frame = frame.with_columns([pl.col(column).cast(pl.String) for column in by if column == 'weekday_name'])
+            frame = frame.group_by(by).agg(sums)
+        else:
+            frame = frame.select(sums)
+        return self.collect(frame).to_pandas()
+
+    def batches(self, products, start, end):
+        frame = self.scan(products, start, end)
+        for batch in frame.collect_batches(chunk_size=BATCH_ROWS):
+            yield batch.to_pandas()
+
+
+class DuckDBBackend(Backend):
+    name = 'duckdb'
+
+    def __init__(self, store_path=TYPED_STORE_PATH, csv_path=CLEAN_CSV_PATH, workers=None):
+        super().__init__(store_path, csv_path, workers)
+        import duckdb
+        self.connection = duckdb.connect()
+        # Without an order to keep, DuckDB can stream results instead of buffering them.
+        self.connection.execute('SET preserve_insertion_order = false')
+
+    def query(self, select, group_by, start, end):
+        if typed_store_available(self.store_path):
+            self.connection.register('sales', sales_dataset(start, end, self.store_path))
+            source = 'sales'
+        else:
+            floats = ', '.join(f'CAST("{product}" AS FLOAT) AS "{product}"'
+                               for product in discover_products(self.store_path, self.csv_path))
+            source = f'(SELECT * REPLACE ({floats}) FROM read_csv_auto(?))'
+        conditions, parameters = [], [] if source == 'sales' else [self.csv_path]
+        for bound, operator in ((start, '>='), (end, '<=')):
+            if bound is not None:
+                conditions.append(f'datum {operator} ?')
+                parameters.append(pd.Timestamp(bound).to_pydatetime())
+        sql = f'SELECT {select} FROM {source}'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        if group_by:
+            sql += ' GROUP BY ' + group_by
+        return self.connection.execute(sql, parameters)
+
+    def group_sums(self, by, products, start, end):
+        keys = [f'CAST("{column}" AS VARCHAR) AS "{column}"' if column == 'weekday_name' else f'"{column}"'
+                for column in by]
+        sums = [f'SUM(CAST("{product}" AS DOUBLE)) AS "{product}"' for product in products]
+        group_by = ', '.join(f'"{column}"' for column in by)
+        return self.query(', '.join(keys + sums), group_by, start, end).df()
+
+    def batches(self, products, start, end):
+        select = ', '.join(f'"{product}"' for product in products)
+        result = self.query(select, '', start, end)
+        # DuckDB 1.4 renamed fetch_record_batch() to to_arrow_reader().
+        reader = result.to_arrow_reader(BATCH_ROWS) if hasattr(result, 'to_arrow_reader') \
+            else result.fetch_record_batch(BATCH_ROWS)
+        for batch in reader:
+            yield batch.to_pandas()
+
+
+BACKEND_CLASSES = {'pandas': PandasBackend, 'polars': PolarsBackend, 'duckdb': DuckDBBackend}
+
+
+# get_backend() returns the backend named by SALES_BACKEND (or by 'name').
+
+def get_backend(name=None, store_path=TYPED_STORE_PATH, csv_path=CLEAN_CSV_PATH, workers=None):
+    name = (name or os.environ.get(BACKEND_ENV) or 'pandas').strip().lower()
+    if name not in BACKEND_CLASSES:
+        raise ValueError(f"{BACKEND_ENV} must be one of {', '.join(BACKENDS)}, not {name!r}")
+    try:
+        return BACKEND_CLASSES[name](store_path, csv_path, workers)
+    except ImportError as error:
+        raise ImportError(f"The {name} backend needs the '{name}' package (pip install {name})") from error
+
+
+# check_backend() runs every aggregation on 'backend' and on pandas and returns one line
+# per aggregation saying whether they agree. Sums can differ in the last digits because
+# they're added up in a different order, so numbers count as equal within 1e-9 of each
+# other (relative). For the spikes and dips only the sales values are compared: on a tie
+# (several days with 0 sales, say) either day is a right answer.
+
+def check_backend(backend, reference, products=None):
+    products = reference.products(products)
+    checks = [('totals ' + (' '.join(by) or '(all)'), lambda b, by=by: b.totals(by, products))
+              for by in ([], ['year', 'month'], ['weekday_name'], ['hour'])]
+    checks += [('daily_totals', lambda b: b.daily_totals(products)),
+               ('correlation', lambda b: b.correlation(products)),
+               ('spikes_and_dips', lambda b: pd.concat(b.spikes_and_dips(products, k=10))[['product', 'rank', 'sales']])]
+    results = []
+    for name, run in checks:
+        expected, got = run(reference), run(backend)
+        if isinstance(expected.index, pd.RangeIndex) or name == 'spikes_and_dips':
+            same_index = len(expected) == len(got)
+        else:
+            labels = [index.to_frame(index=False).astype(str).to_numpy() for index in (expected.index, got.index)]
+            same_index = labels[0].shape == labels[1].shape and bool((labels[0] == labels[1]).all())
+        numbers = expected.select_dtypes('number').to_numpy(dtype='float64')
+        same = (same_index and list(expected.columns) == list(got.columns)
+                and np.allclose(numbers, got.select_dtypes('number').to_numpy(dtype='float64'),
+                                rtol=1e-9, atol=1e-9, equal_nan=True))
+        results.append((name, same))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the sales aggregations with pandas, Polars or DuckDB.')
+    parser.add_argument('--backend', default=None, choices=BACKENDS, help=f'backend to use (default: ${BACKEND_ENV} or pandas)')
+    parser.add_argument('--by', nargs='*', default=['year', 'month'], help='columns to group by (none: grand total)')
+    parser.add_argument('--products', nargs='*', default=None, help='products to aggregate (default: all)')
+    parser.add_argument('--check', action='store_true', help='compare every installed backend with pandas')
+    args = parser.parse_args()
+
+    if args.check:
+        reference = get_backend('pandas')
+        for name in [args.backend] if args.backend else BACKENDS[1:]:
+            try:
+                backend = get_backend(name)
+            except ImportError as error:
+                print(f'{name}: skipped ({error})')
+                continue
+            for check, same in check_backend(backend, reference, args.products):
+                print(f"{name:<8} {check:<28} {'same as pandas' if same else 'DIFFERENT'}")
+    else:
+        print(get_backend(args.backend).totals(args.by, args.products))
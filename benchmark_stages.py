@@ -0,0 +1,192 @@
+# Time every stage of the analysis on big fake data
+#
+# This makes a fake raw file with synthetic_sales_data.py (or uses one you give it) and
+# then runs each stage of the analysis on it, one at a time:
+#
+#   clean        analysis.py's clean_sales_data() (read, dropna, dates, duplicates, write)
+#   load         reading the cleaned data back with load_sales()
+#   correlation  the correlation matrix of all products
+#   rolling      daily totals and the 7/30/90/365-day rolling averages
+#   groupby      the sales cube and the monthly / weekday / hour totals
+#   top_k        the 10 biggest spikes and dips for every product
+#   render       drawing every chart of the three chart scripts (see render_all.py)
+#
+# For every stage it records how long it took (wall clock and CPU time) and the most
+# memory it used at any moment (the "peak"). Python's tracemalloc sees what goes through
+# Python's own allocator (numpy arrays, pandas' numpy columns, Python objects), but not
+# what pyarrow allocates: the typed store is read into pyarrow buffers, and Arrow-backed
+# pandas columns live there too. So the peak is the larger of the tracemalloc peak and
+# the peak of pyarrow's memory pool during the stage.
+# The results are printed as a table and saved as JSON, so two runs (for example before
+# and after a change) can be compared.
+# Measuring memory means running every stage a second time, so add --no-memory when
+# only the timings are needed.
+#
+# Everything is written to a temporary folder, laid out like the project
+# (02_data_clean/, 04_outputs/), which is deleted at the end unless --keep is given.
+#
+# Usage:
+#   python benchmark_stages.py --rows 10000000 --products 300 --chunksize 1000000
+#   python benchmark_stages.py --data synthetic_sales_data.csv --output 04_outputs/benchmark.json
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import pandas as pd  # noqa: E402  (must come after matplotlib.use)
+
+from synthetic_sales_data import write_sales_data  # noqa: E402
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = None
+
+BENCHMARK_PATH = '04_outputs/benchmark_results.json'
+
+
+# measure() runs one stage and adds its numbers to 'results'. It returns whatever the
+# stage returned, so the next stage can use it.
+# tracemalloc slows down code that makes lots of small Python objects (the CSV reader
+# is 10x slower under it), so the timing run is done without it, and the peak memory
+# comes from a second run of the same stage with tracemalloc switched on.
+#
+# pyarrow's memory pool only remembers its highest use over the whole process
+# (max_memory()), it can't be reset. If the stage pushed that to a new high, the stage's
+# pyarrow peak is the new high minus what was allocated when it started; otherwise it's
+# at least what the stage still holds at the end.
+
+def arrow_peak(run):
+    if pa is None:
+        run()
+        return 0
+    pool = pa.default_memory_pool()
+    allocated_before, max_before = pool.bytes_allocated(), pool.max_memory()
+    run()
+    peak = pool.bytes_allocated() - allocated_before
+    if pool.max_memory() > max_before:
+        peak = max(peak, pool.max_memory() - allocated_before)
+    return max(peak, 0)
+
+
+def measure(name, run, results, track_memory=True):
+    gc.collect()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    value = run()
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    peak = None
+    if track_memory:
+        gc.collect()
+        tracemalloc.start()
+        pyarrow_peak = arrow_peak(run)
+        peak = max(tracemalloc.get_traced_memory()[1], pyarrow_peak)
+        tracemalloc.stop()
+    results.append({'stage': name, 'seconds': round(wall, 4), 'cpu_seconds': round(cpu, 4),
+                    'peak_mb': None if peak is None else round(peak / 2**20, 2)})
+    return value
+
+
+def run_benchmark(raw_path, workdir, chunksize=None, track_memory=True):
+    from analysis import clean_sales_data
+    from correlation_stats import CorrelationStats
+    from render_all import render_all
+    from rolling_engine import daily_matrix, rolling_means
+    from sales_cube import build_cube, rollup
+    from sales_store import load_sales, product_columns_in
+    from top_k import spikes_and_dips
+
+    clean_dir = os.path.join(workdir, '02_data_clean')
+    clean_path = os.path.join(clean_dir, 'sales_data_clean.csv')
+    results = []
+
+    summary = measure('clean', lambda: clean_sales_data(raw_path, clean_path, chunksize), results, track_memory)
+    df = measure('load', lambda: load_sales(store_path=os.path.join(clean_dir, 'sales_data_clean.arrow'),
+                                            csv_path=clean_path), results, track_memory)
+    products = product_columns_in(df.columns)
+
+    measure('correlation', lambda: CorrelationStats(products).update(df).corr(), results, track_memory)
+
+    def rolling():
+        daily = daily_matrix(df, products)
+        rolling_means(daily)
+        return daily
+    daily = measure('rolling', rolling, results, track_memory)
+
+    def groupbys():
+        cube = build_cube(df)
+        return [rollup(cube, by, products) for by in (['year', 'month'], ['weekday_name'], ['hour'])]
+    measure('groupby', groupbys, results, track_memory)
+
+    measure('top_k', lambda: spikes_and_dips(daily, products, k=10), results, track_memory)
+
+    # The chart scripts read from 02_data_clean/ relative to where they run, so I move
+    # into the temporary folder while they draw.
+    here = os.getcwd()
+    os.chdir(workdir)
+    try:
+        measure('render', lambda: render_all('04_outputs', workers=0, force=True), results, track_memory)
+    finally:
+        os.chdir(here)
+    return results, summary, products
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time and measure memory for every analysis stage on fake data.')
+    parser.add_argument('--data', default=None, help='existing raw CSV to use instead of generating one')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='rows of fake data to generate')
+    parser.add_argument('--products', type=int, default=100, help='product columns of fake data to generate')
+    parser.add_argument('--chunksize', type=int, default=None, help='clean the raw file in chunks of this many rows')
+    parser.add_argument('--output', default=BENCHMARK_PATH, help='where to save the JSON results')
+    parser.add_argument('--no-memory', action='store_true', help="don't measure peak memory (runs every stage once)")
+    parser.add_argument('--keep', action='store_true', help="don't delete the temporary folder")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='sales_benchmark_')
+    try:
+        raw_path = args.data
+        generate_seconds = None
+        if raw_path is None:
+            raw_path = os.path.join(workdir, 'sales_data.csv')
+            start = time.perf_counter()
+            write_sales_data(raw_path, args.rows, args.products)
+            generate_seconds = time.perf_counter() - start
+        raw_path = os.path.abspath(raw_path)
+        raw_bytes = os.path.getsize(raw_path)
+
+        results, summary, products = run_benchmark(raw_path, workdir, args.chunksize, not args.no_memory)
+    finally:
+        if args.keep:
+            print(f'Benchmark files kept in {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'data': {'path': args.data, 'rows_read': summary['rows_read'], 'rows_written': summary['rows_written'],
+                 'products': len(products), 'bytes': raw_bytes,
+                 'generate_seconds': generate_seconds},
+        'settings': {'chunksize': args.chunksize, 'memory_tracked': not args.no_memory},
+        'machine': {'python': platform.python_version(), 'pandas': pd.__version__,
+                    'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'stages': results,
+    }
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as output:
+        json.dump(report, output, indent=2)
+
+    print(f"{summary['rows_read']} rows x {len(products)} products")
+    print(f"{'stage':<12} {'seconds':>9} {'cpu':>9} {'peak MB':>9}")
+    for result in results:
+        peak = '-' if result['peak_mb'] is None else f"{result['peak_mb']:.1f}"
+        print(f"{result['stage']:<12} {result['seconds']:9.2f} {result['cpu_seconds']:9.2f} {peak:>9}")
+    print(f'Results saved to {args.output}')
@@ -0,0 +1,26 @@
+# Saving and showing charts
+#
+# Every chart in the analysis scripts ends the same way: save the figure into
+# 04_outputs/, maybe show it on screen, and close it so the next chart starts from a
+# clean figure. finish_chart() does those three things in one place.
+#
+# When the charts are drawn by render_all.py there is no screen to show them on, so
+# show=False just saves the file and moves on instead of waiting for a window to be
+# closed.
+
+import os
+
+import matplotlib.pyplot as plt
+
+from instrumentation import traced
+
+OUTPUT_DIR = '04_outputs'
+
+
+def finish_chart(path, show=False):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with traced('savefig'):
+        plt.savefig(path)
+    if show:
+        plt.show()
+    plt.close('all')
@@ -0,0 +1,170 @@
+# Correlation matrix that can be updated and merged
+#
+# df[product_columns].corr() goes through every row of the whole dataset each time it
+# runs. But a correlation matrix only needs a few running numbers per product:
+# - n: how many rows I've seen,
+# - the mean of every product,
+# - the "co-moment" matrix: for every pair of products, the sum over all rows of
+#   (sales of A - mean of A) * (sales of B - mean of B).
+# From those, corr(A, B) = comoment[A, B] / sqrt(comoment[A, A] * comoment[B, B]).
+#
+# These are the same information as the row count, the per-product sums and the
+# sum-of-products matrix, just kept around the means. I keep them this way because
+# subtracting two huge sums of squares (the textbook formula) loses a lot of
+# precision in float64 once there are millions of rows.
+#
+# New rows are added with update(), which costs (new rows x products x products),
+# not the whole history. Two CorrelationStats built on separate parts of the data
+# (different files, stores or worker processes) can be combined exactly with merge().
+# analysis.py keeps one of these up to date while it cleans and saves it to
+# 02_data_clean/correlation_stats.npz.
+#
+# With thousands of products the matrix itself is big (5,000 x 5,000 float64 is
+# 200 MB), so I never make temporary copies of it. New rows are added in blocks of
+# about CELL_BUDGET values, and the co-moment is updated in place one tile of
+# TILE_SIZE products at a time. The biggest temporary array is then one block of rows
+# or one tile of the matrix, never the whole row-level data.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from sales_store import discover_products, iter_sales
+
+CORRELATION_STATS_PATH = '02_data_clean/correlation_stats.npz'
+CELL_BUDGET = 4_000_000
+TILE_SIZE = 1024
+
+# Above this many products the heatmaps only show the best-selling ones (see heatmap_matrix()).
+HEATMAP_LIMIT = 30
+
+
+class CorrelationStats:
+    def __init__(self, products):
+        self.products = list(products)
+        self.n = 0
+        self.mean = np.zeros(len(self.products))
+        self.comoment = np.zeros((len(self.products), len(self.products)))
+
+    # merge() folds another CorrelationStats (same products) into this one.
+    # This is the standard formula for combining two groups: the combined co-moment is
+    # both co-moments added together, plus a correction for how far apart the two
+    # groups' means are.
+
+    def merge(self, other):
+        if other.products != self.products:
+            raise ValueError('Can only merge correlation stats for the same products')
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.n, self.mean, self.comoment = other.n, other.mean.copy(), other.comoment.copy()
+            return self
+        self._add(other.n, other.mean, lambda tile: other.comoment[tile])
+        return self
+
+    # update() adds new rows of data (a DataFrame with the product columns).
+    # Rows with a missing value in any product are skipped, because they can't be
+    # centred consistently for every pair.
+
+    def update(self, df):
+        rows_per_block = max(1, CELL_BUDGET // max(1, len(self.products)))
+        for start in range(0, len(df), rows_per_block):
+            values = df.iloc[start:start + rows_per_block][self.products].to_numpy(dtype='float64')
+            values = values[~np.isnan(values).any(axis=1)]
+            if len(values) == 0:
+                continue
+            mean = values.mean(axis=0)
+            values -= mean
+            self._add(len(values), mean, lambda tile: values[:, tile].T @ values)
+        return self
+
+    # _add() folds a group of n rows with the given means into the stats, in place.
+    # tile_comoment(tile) gives the group's own co-moment rows for one tile of products.
+
+    def _add(self, n, mean, tile_comoment):
+        total = self.n + n
+        delta = mean - self.mean
+        factor = self.n * n / total
+        for start in range(0, len(self.products), TILE_SIZE):
+            tile = slice(start, start + TILE_SIZE)
+            self.comoment[tile] += tile_comoment(tile)
+            self.comoment[tile] += np.outer(delta[tile], delta * factor)
+        self.mean = self.mean + delta * (n / total)
+        self.n = total
+
+    # corr() gives the correlation matrix as a DataFrame, like df.corr() does.
+    # products picks a subset (all products by default).
+
+    def corr(self, products=None):
+        products = self.products if products is None else list(products)
+        position_of = {product: position for position, product in enumerate(self.products)}
+        positions = [position_of[product] for product in products]
+        comoment = self.comoment[np.ix_(positions, positions)]
+        spread = np.sqrt(np.diag(comoment))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            matrix = comoment / np.outer(spread, spread)
+        return pd.DataFrame(matrix, index=products, columns=products)
+
+    def save(self, path=CORRELATION_STATS_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, products=np.array(self.products), n=self.n, mean=self.mean, comoment=self.comoment)
+
+    @classmethod
+    def load(cls, path=CORRELATION_STATS_PATH):
+        with np.load(path) as saved:
+            stats = cls(saved['products'].tolist())
+            stats.n = int(saved['n'])
+            stats.mean = saved['mean']
+            stats.comoment = saved['comoment']
+        return stats
+
+
+# load_correlation_stats() is what the chart scripts use. If analysis.py hasn't saved
+# the stats yet, I build them from the cleaned data instead.
+
+def load_correlation_stats(path=CORRELATION_STATS_PATH):
+    if os.path.exists(path):
+        return CorrelationStats.load(path)
+    products = discover_products()
+    stats = CorrelationStats(products)
+    for part in iter_sales(columns=products):
+        stats.update(part)
+    return stats
+
+
+# cluster_order() puts products that move together next to each other, so groups of
+# related products show up as blocks on the heatmap. It's simple "average linkage"
+# clustering: start with every product on its own, and keep joining the two groups
+# that are most alike (smallest average 1 - correlation) until there is one group.
+# The order in which products end up in that group is the heatmap order.
+# This is only meant for the few dozen products a heatmap can show.
+
+def cluster_order(corr):
+    distance = 1 - np.nan_to_num(corr.to_numpy(), nan=0.0)
+    groups = [[position] for position in range(len(corr))]
+    while len(groups) > 1:
+        closest = None
+        for a in range(len(groups)):
+            for b in range(a + 1, len(groups)):
+                gap = distance[np.ix_(groups[a], groups[b])].mean()
+                if closest is None or gap < closest[0]:
+                    closest = (gap, a, b)
+        _, a, b = closest
+        groups[a] = groups[a] + groups.pop(b)
+    return [corr.index[position] for position in groups[0]]
+
+
+# heatmap_matrix() is the correlation matrix the heatmaps draw. With up to 'limit'
+# products it's the normal matrix in the usual order. With more than that, one square
+# per pair can't be read anymore, so I keep the 'limit' best-selling products (highest
+# average sales, which the stats already know) and put them in clustered order.
+
+def heatmap_matrix(stats, products=None, limit=HEATMAP_LIMIT):
+    products = stats.products if products is None else list(products)
+    if len(products) <= limit:
+        return stats.corr(products)
+    average_sales = pd.Series(stats.mean, index=stats.products)[products]
+    corr = stats.corr(average_sales.nlargest(limit).index)
+    order = cluster_order(corr)
+    return corr.loc[order, order]
@@ -0,0 +1,123 @@
+# Fewer points for long line charts, without losing the peaks and dips
+#
+# A line chart can't show more detail than it has pixels: a 12-inch figure saved at
+# 100 dpi is about 1,000 pixels wide, so a line with millions of points (hourly data over
+# years) draws hundreds of points on top of each other in every pixel column, and
+# matplotlib spends most of its time on points nobody can see.
+#
+# So before plotting, every series is cut down to about the pixel width of the chart.
+# Just taking every n-th point would skip the spikes and dips, which are exactly what we
+# look for, so there are two smarter ways to pick the points:
+#
+# - min-max: split the series into buckets (two points per pixel column) and keep the
+#   lowest and the highest point of every bucket. The drawn line reaches exactly the same
+#   tops and bottoms as the full one. Best for raw, jumpy sales.
+# - LTTB ("largest triangle three buckets"): split the series into one bucket per pixel
+#   and keep the point of each bucket that makes the biggest triangle with the point kept
+#   before it and the average of the next bucket, i.e. the point that changes the shape of
+#   the line the most. Best for smooth lines such as rolling averages.
+#
+# Both always keep the first and the last point, and return the positions of the points
+# they keep, in order, so the dates can be picked out with the same positions.
+#
+# Charts use plot_series(ax, x, y, ...) instead of ax.plot(x, y, ...); it works out how
+# many points the axes can show and does the rest.
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from instrumentation import traced
+
+METHODS = ('minmax', 'lttb')
+
+
+# lttb_indices() returns the positions of n_out points chosen with LTTB. The first and
+# the last point are kept as they are, and the n_out - 2 points in between come from
+# n_out - 2 buckets of about the same size.
+
+def lttb_indices(x, y, n_out):
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    edges = 1 + np.arange(n_out - 1) * (n - 2) // (n_out - 2)
+    counts = np.diff(edges)
+    # The average point of every bucket, worked out for all buckets at once. The bucket
+    # after the last one is the last point itself.
+    average_x = np.append(np.add.reduceat(x[:n - 1], edges[:-1]) / counts, x[-1])
+    average_y = np.append(np.add.reduceat(y[:n - 1], edges[:-1]) / counts, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        # Twice the area of the triangle (previous point, candidate, next bucket's average);
+        # the factor 2 doesn't change which one is the biggest.
+        area = np.abs((x[previous] - average_x[bucket + 1]) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (average_y[bucket + 1] - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+# min_max_indices() returns the positions of at most n_out points: the lowest and the
+# highest of n_out // 2 buckets, plus the first and the last point.
+
+def min_max_indices(y, n_out):
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    y = np.asarray(y, dtype='float64')
+    buckets = n_out // 2
+    edges = np.arange(buckets + 1) * n // buckets
+    bucket_of = np.repeat(np.arange(buckets), np.diff(edges))
+
+    kept = [np.array([0, n - 1])]
+    for extreme in (np.minimum.reduceat(y, edges[:-1]), np.maximum.reduceat(y, edges[:-1])):
+        # The first position in every bucket where the value equals the bucket's extreme.
+        hits = np.flatnonzero(y == extreme[bucket_of])
+        _, first = np.unique(bucket_of[hits], return_index=True)
+        kept.append(hits[first])
+    return np.unique(np.concatenate(kept))
+
+
+def downsample_indices(x, y, n_out, method='lttb'):
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}, not {method!r}")
+    with traced('downsample', rows_in=len(y)) as step:
+        if method == 'lttb':
+            x = np.asarray(x)
+            if np.issubdtype(x.dtype, np.datetime64):
+                x = x.astype('datetime64[ns]').astype(np.int64)
+            positions = lttb_indices(x, y, n_out)
+        else:
+            positions = min_max_indices(y, n_out)
+        step.rows_out = len(positions)
+    return positions
+
+
+# pixel_width() is how many pixels wide the drawing area of 'ax' will be in the saved
+# image (the figure's width in inches times the dpi it's saved with).
+
+def pixel_width(ax):
+    figure = ax.figure
+    dpi = plt.rcParams['savefig.dpi']
+    dpi = figure.dpi if dpi == 'figure' else dpi
+    return max(1, int(round(ax.get_position().width * figure.get_figwidth() * dpi)))
+
+
+# plot_series() plots y against x on 'ax' like ax.plot(x, y, **plot_options), with the
+# series cut down to what the axes can show first. Empty values (NaN, for example the
+# first days of a rolling average) are left out before picking the points.
+#   method: 'minmax' (2 points per pixel, exact peaks) or 'lttb' (1 point per pixel)
+
+def plot_series(ax, x, y, method='lttb', **plot_options):
+    x, y = np.asarray(x), np.asarray(y, dtype='float64')
+    present = ~np.isnan(y)
+    if not present.all():
+        x, y = x[present], y[present]
+    width = pixel_width(ax)
+    positions = downsample_indices(x, y, 2 * width if method == 'minmax' else width, method)
+    return ax.plot(x[positions], y[positions], **plot_options)
@@ -0,0 +1,305 @@
+# Sales forecasts for every product, for inventory planning
+#
+# The charts only look back. This file looks FORECAST_DAYS days ahead for every product
+# with two simple models, and writes the forecasts next to the clean data in
+# 02_data_clean/sales_forecast.csv:
+#
+# - seasonal naive: next Monday sells what last Monday sold. No fitting at all, and a
+#   surprisingly hard baseline to beat for daily pharmacy sales.
+# - Holt-Winters (additive, weekly season, damped trend): keeps three running numbers
+#   per product and updates them every day:
+#     level   = the usual daily sales right now
+#     trend   = how much the level moves per day (damped, so forecasts flatten out)
+#     season  = how much every weekday sells above or below the level
+#   How fast each of them follows new days is set by alpha, beta and gamma. Those are
+#   "fitted": every combination in PARAMETER_GRID is tried, and each product keeps the
+#   one with the smallest one-day-ahead error over its history.
+# Every product then gets the forecast of the model that was more accurate for it
+# (lower RMSE of the one-day-ahead forecasts, after the first BURN_IN_DAYS days).
+#
+# Fitting: each product gets its own model, but the daily recursion is the same for all
+# of them, so one block of products (and all parameter combinations) goes through the
+# days together as numpy arrays. The blocks are spread over a process pool, like
+# parallel_groupby.py does with the part files.
+#
+# Model cache: the fitted parameters, the last level/trend/season and the running errors
+# are kept in 02_data_clean/forecast_models.npz. When analysis.py --incremental added
+# new days, a product whose older history didn't change is updated "warm": only the new
+# days go through the recursion, with the parameters it already has. Products are
+# fitted from scratch when they are new, when their history changed, or when their
+# parameters are older than REFIT_DAYS days.
+#
+# Usage:
+#   python forecasting.py                            # every product, FORECAST_DAYS ahead
+#   python forecasting.py --products m01ab n02be --days 14
+#   python forecasting.py --refit --workers 4        # fit every product from scratch
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backends import get_backend
+from instrumentation import traced
+from parallel_groupby import default_workers
+from sales_store import discover_products
+
+FORECAST_PATH = '02_data_clean/sales_forecast.csv'
+FORECAST_MODELS_PATH = '02_data_clean/forecast_models.npz'
+FORECAST_DAYS = 28
+SEASON_DAYS = 7
+BURN_IN_DAYS = 2 * SEASON_DAYS
+DAMPING = 0.98
+REFIT_DAYS = 28
+BLOCK_PRODUCTS = 500
+
+# (alpha, beta, gamma) combinations tried when fitting Holt-Winters.
+PARAMETER_GRID = [(alpha, beta, gamma)
+                  for alpha, beta, gamma in itertools.product((0.01, 0.03, 0.05, 0.1, 0.2, 0.3, 0.5),
+                                                              (0.0, 0.01, 0.05), (0.01, 0.05, 0.1, 0.2, 0.3))
+                  if beta <= alpha]
+
+
+# holt_winters_pass() runs the daily Holt-Winters updates over 'values' (days x products)
+# and returns the final (level, trend, season) and the squared one-day-ahead errors
+# added up from day 'burn_in' on.
+# alpha/beta/gamma, level and trend have the shape (settings, products) and season the
+# shape (7, settings, products), so many parameter settings run side by side. The
+# season is kept per weekday (0 = Monday), so it doesn't matter on which day a pass starts.
+
+def holt_winters_pass(values, weekdays, alpha, beta, gamma, level, trend, season, burn_in=0):
+    level, trend, season = level.copy(), trend.copy(), season.copy()
+    squared_error = np.zeros(np.broadcast_shapes(alpha.shape, level.shape))
+    for day, (sales, weekday) in enumerate(zip(values, weekdays)):
+        seasonal = season[weekday]
+        expected_level = level + DAMPING * trend
+        error = sales - (expected_level + seasonal)
+        if day >= burn_in:
+            squared_error += error * error
+        new_level = expected_level + alpha * (sales - seasonal - expected_level)
+        trend = DAMPING * trend + beta * (new_level - expected_level)
+        season[weekday] = seasonal + gamma * (sales - new_level - seasonal)
+        level = new_level
+    return level, trend, season, squared_error
+
+
+# starting_state() is where a fresh fit starts: the level is the first week's average,
+# the trend the change from the first to the second week, and the season how far each
+# day of the first week was from that average.
+
+def starting_state(values, weekdays):
+    first_week = values[:SEASON_DAYS].mean(axis=0)
+    second_week = values[SEASON_DAYS:2 * SEASON_DAYS].mean(axis=0)
+    season = np.zeros((SEASON_DAYS,) + first_week.shape)
+    season[weekdays[:SEASON_DAYS]] = values[:SEASON_DAYS] - first_week
+    return first_week, (second_week - first_week) / SEASON_DAYS, season
+
+
+def naive_squared_error(values, start):
+    start = max(start, SEASON_DAYS)
+    return ((values[start:] - values[start - SEASON_DAYS:-SEASON_DAYS]) ** 2).sum(axis=0)
+
+
+# fit_block() fits Holt-Winters for a block of products from scratch (this is what each
+# worker process runs). Every parameter setting runs over the whole history at once,
+# and every product keeps the setting with the smallest error.
+
+def fit_block(values, weekdays):
+    grid = np.array(PARAMETER_GRID)
+    alpha, beta, gamma = (grid[:, [column]] for column in range(3))
+    level, trend, season = starting_state(values, weekdays)
+    shape = (len(grid), values.shape[1])
+    level, trend, season, squared_error = holt_winters_pass(
+        values, weekdays, alpha, beta, gamma, np.broadcast_to(level, shape), np.broadcast_to(trend, shape),
+        np.broadcast_to(season[:, None, :], (SEASON_DAYS,) + shape), burn_in=BURN_IN_DAYS)
+
+    best = np.argmin(squared_error, axis=0)
+    products = np.arange(values.shape[1])
+    return {
+        'alpha': grid[best, 0], 'beta': grid[best, 1], 'gamma': grid[best, 2],
+        'level': level[best, products], 'trend': trend[best, products], 'season': season[:, best, products],
+        'hw_squared_error': squared_error[best, products],
+        'naive_squared_error': naive_squared_error(values, BURN_IN_DAYS),
+        'error_days': np.full(values.shape[1], max(len(values) - BURN_IN_DAYS, 0)),
+    }
+
+
+def fit_models(values, weekdays, workers=None):
+    blocks = [slice(start, start + BLOCK_PRODUCTS) for start in range(0, values.shape[1], BLOCK_PRODUCTS)]
+    workers = default_workers() if workers is None else workers
+    if workers == 0 or len(blocks) == 1:
+        fitted = [fit_block(values[:, block], weekdays) for block in blocks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            fitted = list(pool.map(fit_block, [values[:, block] for block in blocks], itertools.repeat(weekdays)))
+    return {name: np.concatenate([part[name] for part in fitted], axis=-1) for name in fitted[0]}
+
+
+# update_models() is the warm update: the products' saved state goes through the new
+# days only, with the parameters they already have, and the new errors are added to
+# the running totals. 'history' is the whole series, so the seasonal naive errors of
+# the new days can look a week back.
+
+def update_models(models, history, new_days, weekdays):
+    new_values = history[-new_days:]
+    level, trend, season, squared_error = holt_winters_pass(
+        new_values, weekdays[-new_days:], models['alpha'], models['beta'], models['gamma'],
+        models['level'], models['trend'], models['season'])
+    return dict(models, level=level, trend=trend, season=season,
+                hw_squared_error=models['hw_squared_error'] + squared_error,
+                naive_squared_error=models['naive_squared_error'] + naive_squared_error(history, len(history) - new_days),
+                error_days=models['error_days'] + new_days)
+
+
+# history_versions() fingerprints every product's daily series up to (and including)
+# day 'days', so a warm update only happens when the history the model saw is unchanged.
+
+def history_versions(values, first_date, days):
+    prefix = np.ascontiguousarray(values[:days].T)
+    return [hashlib.blake2b(str(first_date).encode() + column.tobytes(), digest_size=12).hexdigest()
+            for column in prefix]
+
+
+def settings_key():
+    return json.dumps({'grid': PARAMETER_GRID, 'damping': DAMPING, 'burn_in': BURN_IN_DAYS})
+
+
+def read_models(path):
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as saved:
+        if str(saved['settings']) != settings_key():
+            return None
+        return {name: saved[name] for name in saved.files}
+
+
+def save_models(path, products, last_date, versions, fitted_on, models):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    np.savez(path, settings=settings_key(), products=np.array(products), last_date=np.datetime64(last_date, 'ns'),
+             versions=np.array(versions), fitted_on=fitted_on, **models)
+
+
+# forecast_days() turns the models into forecasts for the 'horizon' days after the last
+# one: the seasonal naive forecast repeats the last week, Holt-Winters adds the damped
+# trend to the level plus the season of each weekday. Sales can't go below 0.
+
+def forecast_days(models, history, last_date, horizon):
+    dates = pd.date_range(last_date + pd.Timedelta(days=1), periods=horizon, freq='D')
+    steps = np.arange(1, horizon + 1)
+    damped_steps = np.cumsum(DAMPING ** steps)[:, None]
+    holt_winters = models['level'] + damped_steps * models['trend'] + models['season'][dates.dayofweek.to_numpy()]
+
+    last_week = history[-SEASON_DAYS:]
+    last_week_dates = last_date - pd.to_timedelta(np.arange(SEASON_DAYS - 1, -1, -1), unit='D')
+    by_weekday = np.empty_like(last_week)
+    by_weekday[last_week_dates.dayofweek.to_numpy()] = last_week
+    seasonal_naive = by_weekday[dates.dayofweek.to_numpy()]
+    return dates, np.clip(holt_winters, 0, None), np.clip(seasonal_naive, 0, None)
+
+
+# forecast_sales() is the whole nightly job. It returns the forecasts (one row per date
+# and product) and how many products were fitted, updated warm or already up to date.
+
+def forecast_sales(products=None, horizon=FORECAST_DAYS, workers=None, refit=False,
+                   models_path=FORECAST_MODELS_PATH, output_path=FORECAST_PATH):
+    products = discover_products() if products is None else list(products)
+    daily = get_backend(workers=workers).daily_totals(products)[products].asfreq('D').fillna(0)
+    if len(daily) < BURN_IN_DAYS:
+        raise ValueError(f'Forecasting needs at least {BURN_IN_DAYS} days of sales, not {len(daily)}')
+    values = daily.to_numpy(dtype='float64')
+    weekdays = daily.index.dayofweek.to_numpy()
+    first_date, last_date = daily.index[0], daily.index[-1]
+
+    # Which saved models can be reused: same product, same history up to the day the
+    # model last saw, and parameters fitted less than REFIT_DAYS ago.
+    saved = None if refit else read_models(models_path)
+    reusable = np.zeros(len(products), dtype=bool)
+    saved_position = np.zeros(len(products), dtype=np.int64)
+    new_days = 0
+    if saved is not None:
+        saved_last = pd.Timestamp(saved['last_date'][()])
+        known_days = int((saved_last - first_date).days) + 1
+        new_days = len(daily) - known_days
+        if BURN_IN_DAYS <= known_days <= len(daily):
+            position_of = {product: position for position, product in enumerate(saved['products'].tolist())}
+            versions = history_versions(values, first_date, known_days)
+            for column, product in enumerate(products):
+                position = position_of.get(product)
+                if position is None or saved['versions'][position] != versions[column]:
+                    continue
+                if (last_date - pd.Timestamp(saved['fitted_on'][position])).days < REFIT_DAYS:
+                    reusable[column] = True
+                    saved_position[column] = position
+
+    models = {}
+    fitted_on = np.full(len(products), np.datetime64(last_date, 'ns'))
+    stale = np.flatnonzero(~reusable)
+    warm = np.flatnonzero(reusable)
+    with traced('forecast_fit', rows_in=len(stale)) as step:
+        if len(stale):
+            fitted = fit_models(values[:, stale], weekdays, workers)
+            models = {name: np.zeros(array.shape[:-1] + (len(products),)) for name, array in fitted.items()}
+            for name, array in fitted.items():
+                models[name][..., stale] = array
+        step.rows_out = len(stale)
+    with traced('forecast_update', rows_in=len(warm)) as step:
+        if len(warm):
+            kept = {name: saved[name][..., saved_position[warm]]
+                    for name in ('alpha', 'beta', 'gamma', 'level', 'trend', 'season',
+                                 'hw_squared_error', 'naive_squared_error', 'error_days')}
+            if new_days:
+                kept = update_models(kept, values[:, warm], new_days, weekdays)
+            if not models:
+                models = {name: np.zeros(array.shape[:-1] + (len(products),)) for name, array in kept.items()}
+            for name, array in kept.items():
+                models[name][..., warm] = array
+            fitted_on[warm] = saved['fitted_on'][saved_position[warm]]
+        step.rows_out = len(warm)
+
+    save_models(models_path, products, last_date, history_versions(values, first_date, len(daily)), fitted_on, models)
+
+    dates, holt_winters, seasonal_naive = forecast_days(models, values, last_date, horizon)
+    error_days = np.maximum(models['error_days'], 1)
+    hw_rmse = np.sqrt(models['hw_squared_error'] / error_days)
+    naive_rmse = np.sqrt(models['naive_squared_error'] / error_days)
+    use_holt_winters = hw_rmse <= naive_rmse
+    forecast = pd.DataFrame({
+        'datum': np.repeat(dates, len(products)),
+        'product': np.tile(products, horizon),
+        'model': np.tile(np.where(use_holt_winters, 'holt_winters', 'seasonal_naive'), horizon),
+        'forecast': np.where(use_holt_winters, holt_winters, seasonal_naive).ravel(),
+        'holt_winters': holt_winters.ravel(),
+        'seasonal_naive': seasonal_naive.ravel(),
+    })
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    forecast.to_csv(output_path, index=False)
+
+    accuracy = pd.DataFrame({'holt_winters_rmse': hw_rmse, 'seasonal_naive_rmse': naive_rmse,
+                             'alpha': models['alpha'], 'beta': models['beta'], 'gamma': models['gamma']},
+                            index=pd.Index(products, name='product'))
+    counts = {'fitted': len(stale), 'updated': int(len(warm) if new_days else 0),
+              'unchanged': int(0 if new_days else len(warm))}
+    return forecast, accuracy, counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Forecast the daily sales of every product.')
+    parser.add_argument('--products', nargs='*', default=None, help='products to forecast (default: all)')
+    parser.add_argument('--days', type=int, default=FORECAST_DAYS, help='how many days ahead to forecast')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='worker processes for fitting and grouping (default: $SALES_WORKERS or one per CPU core, 0: no workers)')
+    parser.add_argument('--refit', action='store_true', help='ignore the saved models and fit everything again')
+    args = parser.parse_args()
+
+    forecast, accuracy, counts = forecast_sales(args.products, args.days, args.workers, args.refit)
+    print(f"{counts['fitted']} products fitted, {counts['updated']} updated with new days,"
+          f" {counts['unchanged']} unchanged. Forecasts written to {FORECAST_PATH}.")
+    print('\nOne-day-ahead error (RMSE) per model, and the fitted Holt-Winters parameters:')
+    print(accuracy.head(20).round(3).to_string())
+    print(f'\nForecast for the next {args.days} days (first products):')
+    print(forecast.pivot(index='datum', columns='product', values='forecast').iloc[:, :8].round(2).to_string())
@@ -0,0 +1,189 @@
+# Timing and memory trace of the slow steps (switched off unless asked for)
+#
+# When a nightly run gets slower, I want to know which step is to blame: reading the
+# CSV, dropna, parsing the dates, removing duplicates, the groupbys or saving the
+# charts. The scripts wrap each of those steps in traced('step name'), and when
+# tracing is switched on this records for every step:
+# - wall time (seconds on the clock) and CPU time (seconds the processor worked),
+# - rows in and rows out (for example how many rows dropna removed),
+# - how much the step raised the process's peak memory (peak RSS, the most memory the
+#   process has ever held). The peak before the step is subtracted, so a step that
+#   stays below what an earlier step already used shows 0, and only the steps that
+#   pushed memory to a new high show up,
+# - how many times it ran (the cleaning steps run once per chunk, so these add up).
+#
+# At the end of the run everything is saved as a JSON "trace", together with the peak
+# RSS of the whole run (process_peak_rss_mb), and two traces can be compared with:
+#   python instrumentation.py 04_outputs/traces/old.json 04_outputs/traces/new.json
+#
+# Tracing is switched on with the SALES_TRACE environment variable (or --trace on
+# analysis.py and render_all.py):
+#   SALES_TRACE=1 python analysis.py                       # saved in 04_outputs/traces/
+#   SALES_TRACE=my_trace.json python render_all.py         # saved in my_trace.json
+# When it's off, traced() does nothing, so the scripts don't get any slower.
+
+import atexit
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows has no 'resource' module, so peak RSS is left empty there
+    resource = None
+
+TRACE_ENV = 'SALES_TRACE'
+TRACE_DIR = '04_outputs/traces'
+
+# The steps recorded so far in this process, by step name, in the order they first ran.
+_steps = {}
+_started = datetime.now()
+_writer_registered = False
+
+
+def tracing_enabled():
+    return os.environ.get(TRACE_ENV, '').strip().lower() not in ('', '0', 'false', 'no')
+
+
+# enable_tracing() switches tracing on from code (this is what --trace does). It sets
+# the environment variable, so worker processes started afterwards trace too.
+
+def enable_tracing(path=None):
+    os.environ[TRACE_ENV] = path or '1'
+
+
+def trace_path():
+    value = os.environ.get(TRACE_ENV, '').strip()
+    if value.lower() not in ('1', 'true', 'yes', 'on'):
+        return value
+    script = os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0] or 'python'
+    return os.path.join(TRACE_DIR, f"{script}-{_started:%Y%m%d-%H%M%S}-{os.getpid()}.json")
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return round(peak / (2**20 if sys.platform == 'darwin' else 2**10), 2)
+
+
+class Step:
+    def __init__(self, rows_in=None):
+        self.rows_in = rows_in
+        self.rows_out = None
+
+
+# traced() is used as "with traced('dropna', rows_in=len(df)) as step:" around the
+# work, and the code inside sets step.rows_out once it knows it.
+
+@contextmanager
+def traced(name, rows_in=None):
+    step = Step(rows_in)
+    if not tracing_enabled():
+        yield step
+        return
+    wall_start, cpu_start, peak_start = time.perf_counter(), time.process_time(), peak_rss_mb()
+    try:
+        yield step
+    finally:
+        growth = None if peak_start is None else round(peak_rss_mb() - peak_start, 2)
+        record_step(name, time.perf_counter() - wall_start, time.process_time() - cpu_start,
+                    step.rows_in, step.rows_out, rss_growth=growth)
+
+
+# traced_chunks() traces reading from a chunk iterator (read_csv with a chunksize does
+# its reading while the loop asks for the next chunk, not when it's created).
+
+def traced_chunks(name, chunks):
+    chunks = iter(chunks)
+    while True:
+        with traced(name) as step:
+            chunk = next(chunks, None)
+            step.rows_out = None if chunk is None else len(chunk)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def record_step(name, wall, cpu, rows_in=None, rows_out=None, calls=1, rss_growth=None):
+    global _writer_registered
+    if not _writer_registered:
+        atexit.register(write_trace)
+        _writer_registered = True
+
+    totals = _steps.setdefault(name, {'step': name, 'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                      'rows_in': None, 'rows_out': None, 'rss_growth_mb': None})
+    totals['calls'] += calls
+    totals['wall_seconds'] += wall
+    totals['cpu_seconds'] += cpu
+    for key, rows in (('rows_in', rows_in), ('rows_out', rows_out)):
+        if rows is not None:
+            totals[key] = (totals[key] or 0) + int(rows)
+    if rss_growth is not None:
+        totals['rss_growth_mb'] = round((totals['rss_growth_mb'] or 0) + rss_growth, 2)
+
+
+# Worker processes (render_all.py draws charts in a process pool) can't write to this
+# process's trace. take_steps() hands over everything a worker recorded, and
+# add_steps() adds it to the trace of the main process.
+
+def take_steps():
+    steps = list(_steps.values())
+    _steps.clear()
+    return steps
+
+
+def add_steps(steps):
+    for step in steps:
+        record_step(step['step'], step['wall_seconds'], step['cpu_seconds'], step['rows_in'],
+                    step['rows_out'], step['calls'], step['rss_growth_mb'])
+
+
+def write_trace(path=None):
+    if not _steps:
+        return None
+    path = path or trace_path()
+    trace = {
+        'script': os.path.basename(sys.argv[0] or ''),
+        'argv': sys.argv[1:],
+        'started': _started.isoformat(timespec='seconds'),
+        'finished': datetime.now().isoformat(timespec='seconds'),
+        'process_peak_rss_mb': peak_rss_mb(),
+        'steps': [dict(step, wall_seconds=round(step['wall_seconds'], 4),
+                       cpu_seconds=round(step['cpu_seconds'], 4)) for step in _steps.values()],
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as trace_file:
+        json.dump(trace, trace_file, indent=2)
+    return path
+
+
+# compare_traces() lines up the steps of two traces and shows how much slower or faster
+# each one got.
+
+def compare_traces(old_path, new_path):
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old = {step['step']: step for step in json.load(old_file)['steps']}
+        new = {step['step']: step for step in json.load(new_file)['steps']}
+    lines = [f"{'step':<16} {'old s':>9} {'new s':>9} {'change':>8} {'old +MB':>9} {'new +MB':>9}"]
+    for name in list(old) + [name for name in new if name not in old]:
+        before, after = old.get(name, {}), new.get(name, {})
+        old_seconds, new_seconds = before.get('wall_seconds'), after.get('wall_seconds')
+        change = (f'{(new_seconds - old_seconds) / old_seconds:+8.0%}'
+                  if old_seconds and new_seconds is not None else f"{'-':>8}")
+        cells = [f'{value:9.3f}' if value is not None else f"{'-':>9}"
+                 for value in (old_seconds, new_seconds)]
+        memory = [f'{value:9.1f}' if value is not None else f"{'-':>9}"
+                  for value in (before.get('rss_growth_mb'), after.get('rss_growth_mb'))]
+        lines.append(f'{name:<16} {cells[0]} {cells[1]} {change} {memory[0]} {memory[1]}')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit('usage: python instrumentation.py OLD_TRACE.json NEW_TRACE.json')
+    print(compare_traces(sys.argv[1], sys.argv[2]))
@@ -0,0 +1,153 @@
+# Which products lead and which follow: correlation with a delay
+#
+# The correlation heatmap in advanced_analysis.py compares sales on the same day. But
+# "do customers buy N02BA when they buy R03?" can happen with a delay: first a cough
+# medicine, a few days later a painkiller. So here every pair of products is compared
+# at every delay ("lag") from -MAX_LAG to +MAX_LAG days:
+#
+#   corr(a, b, lag) = correlation between a's sales on day t + lag and b's on day t
+#
+# A positive best lag means b leads: a's sales follow b's that many days later. The
+# best lag of a pair is the lag where the correlation is strongest (plus or minus).
+#
+# Shifting the data 181 times per pair and calling .corr() each time would be very
+# slow. A cross-correlation at all lags at once is a multiplication in the frequency
+# domain: FFT both series, multiply one by the conjugate of the other, and an inverse
+# FFT gives the sums for every lag. The FFT of every product is taken once, and the
+# pairs go through the inverse FFT in batches of about CELL_BUDGET numbers, so it's
+# O(n log n) per pair with no Python loop over lags.
+# The series are padded with zeros to at least n + MAX_LAG days, so the end of a series
+# doesn't wrap around onto its start.
+#
+# By default the products are compared on the residual of seasonal_decomposition.py
+# (sales minus trend, weekly and yearly pattern). Otherwise every pair would look most
+# alike at lags of 0, 7, 14... days, only because all products sell more on the same
+# weekdays and in the same season.
+#
+# Usage:
+#   python lead_lag.py                               # strongest lead/lag pairs
+#   python lead_lag.py --max-lag 30 --sales          # on the plain daily sales
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from backends import get_backend
+from instrumentation import traced
+from sales_store import discover_products
+from seasonal_decomposition import load_decomposition
+
+LEAD_LAG_PATH = '02_data_clean/lead_lag.csv'
+MAX_LAG = 90
+CELL_BUDGET = 4_000_000
+
+
+# daily_series() is the days x products table the pairs are compared on: the residual
+# of the seasonal decomposition, or with residual=False the plain daily sales.
+
+def daily_series(products=None, residual=True):
+    products = discover_products() if products is None else list(products)
+    if residual:
+        return load_decomposition(products)['residual']
+    return get_backend().daily_totals(products)[products].asfreq('D')
+
+
+# standardize() gives every column mean 0 and standard deviation 1, so the sums the FFT
+# gives are correlations once divided by the number of days. Empty days count as 0 (the
+# average) and a column that never changes stays all 0.
+
+def standardize(values):
+    mean = np.nanmean(values, axis=0)
+    spread = np.nanstd(values, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        standardized = (values - mean) / spread
+    return np.nan_to_num(standardized, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+# best_lags() compares every pair of columns of 'daily' at every lag and returns three
+# products x products DataFrames:
+#   best_lag[a, b]     the lag (days) where a and b are correlated most strongly
+#   best_corr[a, b]    the correlation at that lag
+#   same_day[a, b]     the correlation at lag 0 (the usual correlation matrix)
+# best_lag[b, a] is -best_lag[a, b]: if b leads a by 3 days, a follows b by 3 days.
+
+def best_lags(daily, max_lag=MAX_LAG):
+    products = list(daily.columns)
+    values = standardize(daily.to_numpy(dtype='float64'))
+    days = len(values)
+    max_lag = min(max_lag, days - 1)
+    size = 1 << int(np.ceil(np.log2(days + max_lag)))
+    spectrum = np.fft.rfft(values, n=size, axis=0)
+
+    # Positions of the lags -max_lag..max_lag in the inverse FFT (negative lags wrap
+    # around to the end), and how many days overlap at every lag.
+    lags = np.arange(-max_lag, max_lag + 1)
+    overlap = (days - np.abs(lags))[:, None]
+
+    count = len(products)
+    best_lag = np.zeros((count, count), dtype=np.int64)
+    best_corr = np.eye(count)
+    same_day = np.eye(count)
+    pairs_per_block = max(1, CELL_BUDGET // size)
+    with traced('lead_lag', rows_in=count * (count - 1) // 2) as step:
+        for first in range(count - 1):
+            for start in range(first + 1, count, pairs_per_block):
+                others = np.arange(start, min(start + pairs_per_block, count))
+                cross = np.fft.irfft(spectrum[:, [first]] * np.conj(spectrum[:, others]), n=size, axis=0)
+                corr = cross[lags % size] / overlap
+                strongest = np.argmax(np.abs(corr), axis=0)
+                chosen = corr[strongest, np.arange(len(others))]
+                best_lag[first, others], best_lag[others, first] = lags[strongest], -lags[strongest]
+                best_corr[first, others] = best_corr[others, first] = chosen
+                same_day[first, others] = same_day[others, first] = corr[max_lag]
+        step.rows_out = count * (count - 1) // 2
+
+    return tuple(pd.DataFrame(matrix, index=products, columns=products) for matrix in (best_lag, best_corr, same_day))
+
+
+# noise_level() is roughly how big a correlation gets by chance between two unrelated
+# series of this many days (2 standard errors). Pairs below it have no lead or lag
+# worth reading.
+
+def noise_level(days):
+    return 2 / np.sqrt(max(days, 1))
+
+
+# lead_lag_pairs() lists every pair once (a before b in product order) with its best
+# lag, sorted by the strength of the correlation at that lag.
+
+def lead_lag_pairs(best_lag, best_corr, same_day):
+    upper = np.triu_indices(len(best_lag), k=1)
+    products = np.array(best_lag.index)
+    pairs = pd.DataFrame({
+        'product_a': products[upper[0]],
+        'product_b': products[upper[1]],
+        'best_lag': best_lag.to_numpy()[upper],
+        'correlation': best_corr.to_numpy()[upper],
+        'same_day_correlation': same_day.to_numpy()[upper],
+    })
+    return pairs.reindex(pairs['correlation'].abs().sort_values(ascending=False).index).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find the delay at which every pair of products correlates best.')
+    parser.add_argument('--products', nargs='*', default=None, help='products to compare (default: all)')
+    parser.add_argument('--max-lag', type=int, default=MAX_LAG, help='largest delay in days to try, both ways')
+    parser.add_argument('--sales', action='store_true',
+                        help='compare the plain daily sales instead of the seasonal-decomposition residual')
+    parser.add_argument('--top', type=int, default=15, help='how many of the strongest pairs to print')
+    args = parser.parse_args()
+
+    daily = daily_series(args.products, residual=not args.sales)
+    best_lag, best_corr, same_day = best_lags(daily, args.max_lag)
+    pairs = lead_lag_pairs(best_lag, best_corr, same_day)
+    os.makedirs(os.path.dirname(LEAD_LAG_PATH), exist_ok=True)
+    pairs.to_csv(LEAD_LAG_PATH, index=False)
+
+    print(f'Best lag in days (positive: the column product leads the row product), |correlation| at least'
+          f' {noise_level(len(daily)):.3f}:')
+    print(best_lag.where(best_corr.abs() >= noise_level(len(daily))).to_string(na_rep='.'))
+    print(f'\nStrongest {args.top} pairs (all pairs written to {LEAD_LAG_PATH}):')
+    print(pairs.head(args.top).round(3).to_string(index=False))
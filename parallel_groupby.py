@@ -0,0 +1,176 @@
+# Big groupbys spread over several processes
+#
+# A pandas groupby runs on one CPU core, however many the machine has. But sums,
+# counts, minimums and maximums can be worked out piece by piece and combined later:
+# - the sum of a group is the sum of its sums in every piece,
+# - the count is the sum of the counts,
+# - the minimum is the smallest of the minimums, the maximum the largest maximum,
+# - and the mean is (total sum) / (total count), so it comes out exactly right too,
+#   which averaging the pieces' means would not (the pieces have different sizes).
+#
+# So parallel_groupby() splits the part files of the typed store (see sales_store.py)
+# between worker processes. Every worker reads its own parts (the whole table never
+# goes through the main process) and returns these "partial aggregates" per group,
+# which are tiny compared to the data. The main process merges them with the rules
+# above. With N cores the reading and grouping runs about N times faster.
+#
+# Usage:
+#   python parallel_groupby.py --by weekday_name hour --aggregations mean min max
+#   python parallel_groupby.py --by year month --products m01ab n02be --start 2018-01-01
+#   python parallel_groupby.py --rebuild-cube           # rebuild 02_data_clean/sales_cube.csv
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from instrumentation import traced
+from sales_store import (CLEAN_CSV_PATH, TYPED_STORE_PATH, discover_products, iter_sales, read_store_part,
+                         store_parts, typed_store_available)
+
+AGGREGATIONS = ('sum', 'count', 'min', 'max', 'mean')
+
+# How many worker processes to use when the caller doesn't say. render_all.py sets it to
+# 0 in its own worker processes: each of them already has a core, and a pool of
+# os.cpu_count() processes inside every one would only fight over the same cores.
+WORKERS_ENV = 'SALES_WORKERS'
+
+# How each partial aggregate is combined: 'rows' is the number of rows per group.
+MERGE_RULES = {'rows': 'sum', 'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+
+
+# partial_aggregates() groups one piece of data and returns
+# {'rows': rows per group, 'sum': ..., 'count': ..., 'min': ..., 'max': ...}.
+# The values are added up as float64, so float32 sales don't lose precision.
+
+def partial_aggregates(df, by, values):
+    sales = pd.DataFrame(df[values].to_numpy(dtype='float64'), index=df.index, columns=values)
+    grouped = sales.groupby([df[column] for column in by], observed=True, sort=False)
+    return {'rows': grouped.size(), 'sum': grouped.sum(), 'count': grouped.count(),
+            'min': grouped.min(), 'max': grouped.max()}
+
+
+def merge_partials(partials):
+    partials = [partial for partial in partials if partial is not None]
+    if len(partials) == 1:
+        return partials[0]
+    merged = {}
+    for key, rule in MERGE_RULES.items():
+        stacked = pd.concat([partial[key] for partial in partials])
+        merged[key] = stacked.groupby(level=list(range(stacked.index.nlevels)), observed=True).agg(rule)
+    return merged
+
+
+# aggregate_parts() is what one worker process runs: it reads its part files one by
+# one and keeps merging, so it only ever holds one part plus the running partials.
+
+def aggregate_parts(part_paths, by, values, start=None, end=None):
+    columns = list(by) + [value for value in values if value not in by]
+    if start is not None or end is not None:
+        columns = columns if 'datum' in columns else columns + ['datum']
+    merged = None
+    for part_path in part_paths:
+        df = read_store_part(part_path, columns, start, end).to_pandas()
+        if len(df):
+            merged = merge_partials([merged, partial_aggregates(df, by, values)])
+    return merged
+
+
+def default_workers():
+    value = os.environ.get(WORKERS_ENV, '').strip()
+    return int(value) if value else os.cpu_count()
+
+
+# balanced_batches() splits the part files into n batches of about the same total size
+# (biggest files first, each one going to the batch with the least data so far).
+
+def balanced_batches(part_paths, n):
+    batches = [[] for _ in range(max(1, n))]
+    sizes = [0] * len(batches)
+    for part_path in sorted(part_paths, key=os.path.getsize, reverse=True):
+        smallest = sizes.index(min(sizes))
+        batches[smallest].append(part_path)
+        sizes[smallest] += os.path.getsize(part_path)
+    return [batch for batch in batches if batch]
+
+
+# finish() turns the merged partials into the result, shaped like
+# df.groupby(by)[values].agg(aggregations): one column per (value, aggregation).
+# 'size' is the number of rows per group, as a column of its own.
+
+def finish(merged, values, aggregations):
+    columns = {}
+    for value in values:
+        for aggregation in aggregations:
+            if aggregation == 'size':
+                continue
+            if aggregation == 'mean':
+                columns[(value, 'mean')] = merged['sum'][value] / merged['count'][value]
+            else:
+                columns[(value, aggregation)] = merged[aggregation][value]
+    if 'size' in aggregations:
+        columns[('size', '')] = merged['rows']
+    result = pd.DataFrame(columns)
+    result.columns = pd.MultiIndex.from_tuples(list(columns))
+    return result.sort_index()
+
+
+# parallel_groupby() is the whole thing:
+#   by: the columns to group by, e.g. ['weekday_name', 'hour']
+#   values: the columns to aggregate (all products by default)
+#   aggregations: any of 'sum', 'count', 'min', 'max', 'mean' and 'size'
+#   workers: number of processes (default: $SALES_WORKERS or one per CPU core,
+#            0: everything in this process)
+#   start/end: only use rows in this date range (only those months are read)
+# Without the typed store (pyarrow not installed) it goes through the CSV in chunks in
+# this process, with the same partial aggregates.
+
+def parallel_groupby(by, values=None, aggregations=AGGREGATIONS, workers=None, start=None, end=None,
+                     store_path=TYPED_STORE_PATH, csv_path=CLEAN_CSV_PATH):
+    by = list(by)
+    values = discover_products(store_path, csv_path) if values is None else list(values)
+    with traced('parallel_groupby') as step:
+        if typed_store_available(store_path):
+            part_paths = store_parts(store_path, start, end)
+            workers = default_workers() if workers is None else workers
+            if workers == 0:
+                partials = [aggregate_parts(part_paths, by, values, start, end)]
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futures = [pool.submit(aggregate_parts, batch, by, values, start, end)
+                               for batch in balanced_batches(part_paths, workers)]
+                    partials = [future.result() for future in futures]
+        else:
+            columns = by + [value for value in values if value not in by]
+            partials = [partial_aggregates(chunk, by, values)
+                        for chunk in iter_sales(columns, store_path, csv_path, start=start, end=end)]
+        partials = [partial for partial in partials if partial is not None]
+        if not partials:
+            # Nothing in that date range: an empty result with the usual columns.
+            columns = by + [value for value in values if value not in by]
+            partials = [partial_aggregates(pd.DataFrame(columns=columns), by, values)]
+        result = finish(merge_partials(partials), values, aggregations)
+        step.rows_out = len(result)
+    return result
+
+
+if __name__ == '__main__':
+    from sales_cube import CUBE_PATH, rebuild_cube, save_cube
+
+    parser = argparse.ArgumentParser(description='Group the cleaned sales data using several processes.')
+    parser.add_argument('--by', nargs='+', default=['weekday_name', 'hour'], help='columns to group by')
+    parser.add_argument('--products', nargs='*', default=None, help='products to aggregate (default: all)')
+    parser.add_argument('--aggregations', nargs='+', default=list(AGGREGATIONS),
+                        choices=list(AGGREGATIONS) + ['size'], help='what to compute per group')
+    parser.add_argument('--start', default=None, help='first date to include, e.g. 2019-01-01')
+    parser.add_argument('--end', default=None, help='last date to include')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU core)')
+    parser.add_argument('--rebuild-cube', action='store_true', help=f'rebuild {CUBE_PATH} from the typed store')
+    args = parser.parse_args()
+
+    if args.rebuild_cube:
+        save_cube(rebuild_cube(workers=args.workers))
+        print(f'Rebuilt {CUBE_PATH}')
+    else:
+        print(parallel_groupby(args.by, args.products, args.aggregations, args.workers, args.start, args.end))
@@ -0,0 +1,249 @@
+# Run the whole analysis as one pipeline, skipping the stages that haven't changed
+#
+# The scripts used to be run by hand one after the other, and each run cleaned and
+# added up everything again from scratch. Here the work is split into four stages:
+#
+#   ingest  -> fingerprint the raw sales_data.csv
+#   clean   -> analysis.py's cleaner (clean CSV, typed Arrow parts, cube, correlation stats)
+#   aggregate -> daily totals, rolling averages, monthly totals and top-K spikes/dips
+#   render  -> every chart, drawn headless (see render_all.py)
+#
+# Every stage says what it depends on: input files, the Python files with its code,
+# its parameters (for example the product list or the rolling windows) and the
+# stages before it. I hash all of that into a "key". A stage's results are stored in
+# .pipeline_cache/<stage>/<key>/, so if the key is the same as in an earlier run, the
+# stored results are reused and the stage doesn't run at all.
+# For example, after changing a chart, only the chart code changed, so only 'render'
+# gets a new key; cleaning and aggregating are skipped.
+#
+# The aggregates end up in 02_data_clean/aggregates/, and the charts that need daily
+# totals, rolling averages or the top days read them from there (read_aggregate()), so
+# 'render' depends on 'aggregate' and those numbers are only worked out once.
+#
+# Usage:
+#   python pipeline.py                   # run (or reuse) every stage
+#   python pipeline.py --force           # ignore the cache and run everything again
+#   python pipeline.py --windows 7 30 --top-k 5
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+CACHE_DIR = '.pipeline_cache'
+RAW_PATH = 'sales_data.csv'
+CLEAN_DIR = '02_data_clean'
+OUTPUT_DIR = '04_outputs'
+AGGREGATES_DIR = os.path.join(CLEAN_DIR, 'aggregates')
+
+CLEAN_CODE = ['analysis.py', 'date_parsing.py', 'validation.py', 'sales_store.py', 'sales_cube.py',
+              'correlation_stats.py', 'anomaly_detector.py']
+AGGREGATE_CODE = ['pipeline.py', 'sales_store.py', 'rolling_engine.py', 'top_k.py', 'sales_cube.py']
+
+
+# render_code() is the code the render stage depends on: the chart scripts plus the
+# code every chart goes through, taken from render_all.py so the two lists can't drift
+# apart. It's only imported when the stages are built (render_all.py loads matplotlib).
+
+def render_code():
+    from render_all import CHART_SCRIPTS, SHARED_CHART_CODE
+    return sorted(set(SHARED_CHART_CODE) | {module_name + '.py' for module_name in CHART_SCRIPTS})
+
+
+# read_aggregate() gives a chart one of the aggregate stage's tables, for example
+# read_aggregate('daily_sales.csv'). It returns None, and the chart works the numbers
+# out itself, when the file isn't there (the pipeline hasn't run), when it's older than
+# the cleaned data (analysis.py cleaned again since), or when one of 'columns' is missing
+# (the pipeline ran for other products).
+
+def read_aggregate(name, columns=(), index_col=None, clean_path=os.path.join(CLEAN_DIR, 'sales_data_clean.csv')):
+    import pandas as pd
+    path = os.path.join(AGGREGATES_DIR, name)
+    if not os.path.exists(path):
+        return None
+    if os.path.exists(clean_path) and os.path.getmtime(path) < os.path.getmtime(clean_path):
+        return None
+    table = pd.read_csv(path, index_col=index_col, parse_dates=['datum'])
+    if not set(columns) <= set(table.columns):
+        return None
+    return table
+
+
+# file_digest() hashes the contents of a file. Hashing a multi-GB raw file takes a few
+# seconds, so I remember each file's hash together with its size and modification
+# time, and only hash it again when one of those changes.
+
+def file_digest(path, memo):
+    stat = os.stat(path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    remembered = memo.get(os.path.abspath(path))
+    if remembered and remembered['signature'] == signature:
+        return remembered['digest']
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(1 << 20), b''):
+            digest.update(block)
+    memo[os.path.abspath(path)] = {'signature': signature, 'digest': digest.hexdigest()}
+    return digest.hexdigest()
+
+
+class Stage:
+    def __init__(self, name, run, inputs=(), code=(), params=None, upstream=(), publish_to=None):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.code = list(code)
+        self.params = params or {}
+        self.upstream = list(upstream)
+        self.publish_to = publish_to
+
+    def key(self, upstream_keys, memo):
+        description = {
+            'stage': self.name,
+            'inputs': {path: file_digest(path, memo) for path in self.inputs},
+            'code': {path: file_digest(path, memo) for path in self.code},
+            'params': self.params,
+            'upstream': [upstream_keys[name] for name in self.upstream],
+        }
+        encoded = json.dumps(description, sort_keys=True, default=str).encode()
+        return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+# publish() copies a stage's cached results to where the scripts expect them (for
+# example 02_data_clean/). A small '.pipeline_key' file remembers which results are in
+# there, so they're only copied again when they actually changed.
+
+def publish(stage_dir, target_dir, key):
+    marker = os.path.join(target_dir, '.pipeline_key')
+    if os.path.exists(marker):
+        with open(marker) as marker_file:
+            if marker_file.read().strip() == key:
+                return False
+    os.makedirs(target_dir, exist_ok=True)
+    for name in os.listdir(stage_dir):
+        source = os.path.join(stage_dir, name)
+        target = os.path.join(target_dir, name)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        if os.path.isdir(source):
+            shutil.copytree(source, target)
+        else:
+            shutil.copy2(source, target)
+    with open(marker, 'w') as marker_file:
+        marker_file.write(key)
+    return True
+
+
+def run_pipeline(stages, force=False, cache_dir=CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+    memo_path = os.path.join(cache_dir, 'file_digests.json')
+    memo = {}
+    if os.path.exists(memo_path):
+        with open(memo_path) as memo_file:
+            memo = json.load(memo_file)
+
+    keys, directories, report = {}, {}, []
+    for stage in stages:
+        key = stage.key(keys, memo)
+        stage_dir = os.path.join(cache_dir, stage.name, key)
+        done_marker = os.path.join(stage_dir, '.complete')
+        start = time.perf_counter()
+
+        cached = os.path.exists(done_marker) and not force
+        if not cached:
+            if os.path.isdir(stage_dir):
+                shutil.rmtree(stage_dir)
+            os.makedirs(stage_dir)
+            stage.run(stage_dir, {name: directories[name] for name in stage.upstream})
+            open(done_marker, 'w').close()
+        if stage.publish_to:
+            publish(stage_dir, stage.publish_to, key)
+
+        keys[stage.name] = key
+        directories[stage.name] = stage_dir
+        report.append((stage.name, 'cached' if cached else 'ran', key, time.perf_counter() - start))
+
+    with open(memo_path, 'w') as memo_file:
+        json.dump(memo, memo_file)
+    return report
+
+
+# The four stages. Each run function gets its own empty folder to write into
+# ('stage_dir') and the folders of the stages it depends on ('upstream').
+# The imports are inside the functions so a fully cached run doesn't even load them.
+
+def ingest(stage_dir, upstream, raw_path=RAW_PATH):
+    import pandas as pd
+    header = list(pd.read_csv(raw_path, nrows=0).columns)
+    with open(os.path.join(stage_dir, 'ingest.json'), 'w') as info:
+        json.dump({'raw_path': os.path.abspath(raw_path), 'bytes': os.path.getsize(raw_path),
+                   'columns': header}, info, indent=2)
+
+
+def clean(stage_dir, upstream, raw_path=RAW_PATH, chunksize=None):
+    from analysis import clean_sales_data
+    clean_sales_data(raw_path, os.path.join(stage_dir, 'sales_data_clean.csv'), chunksize)
+
+
+def aggregate(stage_dir, upstream, products=None, windows=(7, 30, 90, 365), top_k=10):
+    from rolling_engine import daily_matrix, rolling_means
+    from sales_cube import load_cube, rollup
+    from sales_store import load_sales, product_columns_in
+    from top_k import spikes_and_dips
+
+    clean_dir = upstream['clean']
+    df = load_sales(store_path=os.path.join(clean_dir, 'sales_data_clean.arrow'),
+                    csv_path=os.path.join(clean_dir, 'sales_data_clean.csv'))
+    products = products or product_columns_in(df.columns)
+
+    daily = daily_matrix(df, products)
+    daily['total_sales'] = daily[products].sum(axis=1)
+    daily.to_csv(os.path.join(stage_dir, 'daily_sales.csv'))
+    for window, means in rolling_means(daily, windows).items():
+        means.to_csv(os.path.join(stage_dir, f'rolling_{window}.csv'))
+
+    spikes, dips = spikes_and_dips(daily, daily.columns, k=top_k)
+    spikes.to_csv(os.path.join(stage_dir, 'top_spikes.csv'), index=False)
+    dips.to_csv(os.path.join(stage_dir, 'top_dips.csv'), index=False)
+
+    cube = load_cube(os.path.join(clean_dir, 'sales_cube.csv'))
+    rollup(cube, ['year', 'month'], products).to_csv(os.path.join(stage_dir, 'monthly_sales.csv'))
+
+
+def render(stage_dir, upstream, workers=None):
+    from render_all import render_all
+    render_all(stage_dir, workers)
+
+
+def build_stages(raw_path=RAW_PATH, products=None, windows=(7, 30, 90, 365), top_k=10,
+                 chunksize=None, workers=None):
+    return [
+        Stage('ingest', lambda stage_dir, upstream: ingest(stage_dir, upstream, raw_path),
+              inputs=[raw_path]),
+        Stage('clean', lambda stage_dir, upstream: clean(stage_dir, upstream, raw_path, chunksize),
+              code=CLEAN_CODE, upstream=['ingest'], publish_to=CLEAN_DIR),
+        Stage('aggregate', lambda stage_dir, upstream: aggregate(stage_dir, upstream, products, windows, top_k),
+              code=AGGREGATE_CODE, upstream=['clean'],
+              params={'products': products, 'windows': list(windows), 'top_k': top_k},
+              publish_to=AGGREGATES_DIR),
+        Stage('render', lambda stage_dir, upstream: render(stage_dir, upstream, workers),
+              code=render_code(), upstream=['clean', 'aggregate'], publish_to=OUTPUT_DIR),
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run ingest -> clean -> aggregate -> render, reusing cached stages.')
+    parser.add_argument('--input', default=RAW_PATH, help='raw sales CSV')
+    parser.add_argument('--products', nargs='*', default=None, help='products to aggregate (default: all)')
+    parser.add_argument('--windows', nargs='*', type=int, default=[7, 30, 90, 365], help='rolling windows in days')
+    parser.add_argument('--top-k', type=int, default=10, help='how many spikes/dips to keep')
+    parser.add_argument('--chunksize', type=int, default=None, help='clean the raw file in chunks of this many rows')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes for rendering')
+    parser.add_argument('--force', action='store_true', help='ignore cached results and run every stage')
+    args = parser.parse_args()
+
+    stages = build_stages(args.input, args.products, args.windows, args.top_k, args.chunksize, args.workers)
+    for name, status, key, seconds in run_pipeline(stages, force=args.force):
+        print(f'{name:<10} {status:<7} {seconds:7.2f}s  {key}')
@@ -0,0 +1,303 @@
+# A small local web service that answers chart questions as JSON
+#
+# The charts in 04_outputs/ are fixed pictures. When someone wants "the same chart,
+# but only for M01AB" or "only 2019", a script has to be changed and run again.
+# This service answers those questions directly, from the aggregates the cleaner
+# already keeps (the cube, the correlation stats and the typed store):
+#
+#   /monthly?products=m01ab,n02be&year=2019          monthly totals
+#   /profile?by=weekday_name,hour&how=mean            weekday / hour profiles
+#   /correlation?products=m01ab,m01ae,r03             correlation matrix
+#   /topk?product=m01ab&k=10&start=2019-01-01         top-K spike and dip days
+#   /version                                          the current data version
+#
+# Every answer is kept in memory (an LRU cache: when it's full, the answer that was
+# used longest ago is dropped). The cache key is the question plus the "data version",
+# a fingerprint of the files the answers come from, so when analysis.py cleans new
+# data, old answers are never served again.
+# Every answer also gets an ETag. A client that sends it back (If-None-Match) gets a
+# short "304 Not Modified" instead of the whole answer again.
+#
+# The service uses asyncio, so it can keep many connections open at once. The pandas
+# work runs in a background thread, so a slow question doesn't hold up quick ones.
+# It runs in that thread itself (workers=0): starting a pool of worker processes for
+# every request would cost more than the question itself.
+#
+# Numbers are sent as float64 rounded to DECIMALS places, so a float32 sale of 12.3
+# doesn't come out as 12.3000001907.
+#
+# Usage:
+#   python query_service.py --port 8765
+#   curl 'http://127.0.0.1:8765/monthly?products=m01ab&year=2019'
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from backends import get_backend
+from correlation_stats import CORRELATION_STATS_PATH, load_correlation_stats
+from sales_cube import CUBE_PATH, load_cube, rollup
+from sales_store import CLEAN_CSV_PATH, discover_products
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+CACHE_SIZE = 256
+DECIMALS = 4
+
+# analysis.py rewrites this file at the end of every clean, full or incremental.
+CLEAN_STATE_PATH = '02_data_clean/clean_state.json'
+
+STATUS_TEXT = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class QueryError(ValueError):
+    pass
+
+
+# data_version() fingerprints the files every answer comes from, using only their size
+# and modification time, so it costs a few microseconds instead of reading them.
+
+def data_version():
+    fingerprint = hashlib.blake2b(digest_size=8)
+    for path in (CLEAN_STATE_PATH, CUBE_PATH, CORRELATION_STATS_PATH, CLEAN_CSV_PATH):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            fingerprint.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    return fingerprint.hexdigest()
+
+
+# Helpers to read the query string: ?products=a,b&year=2019
+
+def list_parameter(params, name):
+    value = params.get(name)
+    return None if not value else [item for item in value.split(',') if item]
+
+
+def int_parameter(params, name, default=None):
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError(f'{name} must be a whole number, not {value!r}')
+
+
+def date_parameter(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        return pd.Timestamp(value)
+    except ValueError:
+        raise QueryError(f'{name} must be a date like 2019-01-31, not {value!r}')
+
+
+def check_products(products):
+    known = discover_products()
+    if products is None:
+        return known
+    unknown = [product for product in products if product not in known]
+    if unknown:
+        raise QueryError(f'unknown products: {", ".join(unknown)}')
+    return products
+
+
+def rounded(frame):
+    floats = frame.select_dtypes('floating').columns
+    return frame.astype({column: 'float64' for column in floats}).round({column: DECIMALS for column in floats})
+
+
+def records(frame):
+    return json.loads(rounded(frame.reset_index()).to_json(orient='records', date_format='iso'))
+
+
+# The questions the service answers. Each one gets the query parameters as a dict and
+# returns something json.dumps() can write.
+
+def query_monthly(params):
+    products = check_products(list_parameter(params, 'products'))
+    cube = load_cube()
+    year = int_parameter(params, 'year')
+    if year is not None:
+        cube = cube[cube['year'] == year]
+    return records(rollup(cube, ['year', 'month'], products))
+
+
+def query_profile(params):
+    products = check_products(list_parameter(params, 'products'))
+    by = list_parameter(params, 'by') or ['weekday_name', 'hour']
+    how = params.get('how', 'sum')
+    if not set(by) <= {'year', 'month', 'weekday_name', 'hour'}:
+        raise QueryError('by can only use year, month, weekday_name and hour')
+    if how not in ('sum', 'mean'):
+        raise QueryError("how must be 'sum' or 'mean'")
+    cube = load_cube()
+    year = int_parameter(params, 'year')
+    if year is not None:
+        cube = cube[cube['year'] == year]
+    return records(rollup(cube, by, products, how=how))
+
+
+def query_correlation(params):
+    products = check_products(list_parameter(params, 'products'))
+    matrix = rounded(load_correlation_stats().corr(products))
+    return {'products': products, 'matrix': json.loads(matrix.to_json(orient='values'))}
+
+
+def query_topk(params):
+    products = list_parameter(params, 'product') or list_parameter(params, 'products')
+    products = check_products(products)
+    k = int_parameter(params, 'k', 10)
+    if not 1 <= k <= 1000:
+        raise QueryError('k must be between 1 and 1000')
+    start, end = date_parameter(params, 'start'), date_parameter(params, 'end')
+    if start is not None and end is not None and start > end:
+        raise QueryError('start must not be after end')
+    # A range without any sales gives empty lists.
+    spikes, dips = get_backend(workers=0).spikes_and_dips(products, k, start, end)
+    return {'spikes': records(spikes.set_index('product')), 'dips': records(dips.set_index('product'))}
+
+
+def query_version(params):
+    return {'data_version': data_version()}
+
+
+QUERIES = {
+    '/monthly': query_monthly,
+    '/profile': query_profile,
+    '/correlation': query_correlation,
+    '/topk': query_topk,
+    '/version': query_version,
+}
+
+
+# QueryCache is the LRU cache: an OrderedDict where every hit is moved to the end, so
+# the entry at the front is always the one used longest ago.
+
+class QueryCache:
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class QueryService:
+    def __init__(self, cache_size=CACHE_SIZE):
+        self.cache = QueryCache(cache_size)
+
+    # answer() returns (status, body bytes, etag) for one request path like
+    # '/monthly?year=2019'. Only the first value of every parameter is used, and the
+    # parameters are sorted, so '?a=1&b=2' and '?b=2&a=1' share a cache entry.
+
+    async def answer(self, target):
+        url = urlsplit(target)
+        query = QUERIES.get(url.path.rstrip('/') or '/')
+        if query is None:
+            return 404, json.dumps({'error': f'unknown path {url.path}', 'paths': sorted(QUERIES)}).encode(), None
+        params = {name: values[0] for name, values in parse_qs(url.query).items()}
+
+        version = data_version()
+        key = (url.path, tuple(sorted(params.items())), version)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return 200, cached[0], cached[1]
+
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(None, query, params)
+        except QueryError as error:
+            return 400, json.dumps({'error': str(error)}).encode(), None
+        except Exception as error:
+            return 500, json.dumps({'error': f'{type(error).__name__}: {error}'}).encode(), None
+        body = json.dumps({'data_version': version, 'result': result}).encode()
+        etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.cache.put(key, (body, etag))
+        return 200, body, etag
+
+    # handle_connection() speaks just enough HTTP/1.1 for GET requests, and keeps the
+    # connection open for more requests unless the client says 'Connection: close'.
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3 or parts[0] not in ('GET', 'HEAD'):
+                    status, body, etag = 405, b'{"error": "only GET is supported"}', None
+                else:
+                    status, body, etag = await self.answer(parts[1])
+                    if etag is not None and headers.get('if-none-match') == etag:
+                        status, body = 304, b''
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                response = [f'HTTP/1.1 {status} {STATUS_TEXT[status]}',
+                            'Content-Type: application/json',
+                            f'Content-Length: {len(body)}',
+                            'Cache-Control: no-cache',
+                            f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                if etag is not None:
+                    response.append(f'ETag: {etag}')
+                writer.write(('\r\n'.join(response) + '\r\n\r\n').encode('latin-1'))
+                if parts and parts[0] != 'HEAD':
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, cache_size=CACHE_SIZE):
+    service = QueryService(cache_size)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f'Serving sales queries on http://{host}:{port}/ ({", ".join(sorted(QUERIES))})')
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the sales aggregates as JSON over HTTP.')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='address to listen on (default: only this machine)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on')
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help='how many answers to keep in memory')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.cache_size))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,189 @@
+# Draw every chart without a screen, in parallel
+#
+# Running the three chart scripts by hand opens a window for every chart and waits for
+# it to be closed (plt.show()), so they can't run in the nightly job. This script draws
+# all the charts of exploration_visualization.py, sales_data_visualizations.py and
+# advanced_analysis.py straight into 04_outputs/ instead:
+# - it switches matplotlib to the 'Agg' backend, which draws into image files and never
+#   opens a window, and calls every chart function with show=False;
+# - the charts don't depend on each other, so each one is drawn in its own worker
+#   process, and the whole report takes about as long as the slowest chart.
+#
+# Most nights only some of the data changes (or none of it), so drawing every chart
+# again is wasted work. render_manifest.json in the output folder remembers, for every
+# image, a "render key": a hash of the data files the chart reads (each script lists
+# them in its CHARTS), the code that draws it and the matplotlib version. A chart is
+# only drawn again when its key changed or its image is missing; --force draws them all.
+#
+# Usage:
+#   python render_all.py                  # one worker per CPU core
+#   python render_all.py --workers 4 --output-dir 04_outputs
+#   python render_all.py --workers 0      # draw everything in this process, one by one
+#   python render_all.py --force          # draw every chart, even the unchanged ones
+
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+from chart_output import OUTPUT_DIR  # noqa: E402  (must come after matplotlib.use)
+from instrumentation import add_steps, enable_tracing, take_steps  # noqa: E402
+from parallel_groupby import WORKERS_ENV  # noqa: E402
+from pipeline import file_digest  # noqa: E402
+
+CHART_SCRIPTS = ['exploration_visualization', 'sales_data_visualizations', 'advanced_analysis']
+MANIFEST_NAME = 'render_manifest.json'
+
+# The code every chart goes through besides its own script. Changing one of these draws
+# every chart again.
+SHARED_CHART_CODE = ['render_all.py', 'chart_output.py', 'downsample.py', 'backends.py', 'parallel_groupby.py',
+                     'sales_cube.py', 'correlation_stats.py', 'sales_store.py', 'rolling_engine.py', 'top_k.py',
+                     'seasonal_decomposition.py', 'lead_lag.py', 'anomaly_detector.py', 'instrumentation.py',
+                     'pipeline.py']
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def use_headless_backend():
+    matplotlib.use('Agg')
+
+
+# start_render_worker() sets up every worker process of the pool: no screen, and no
+# process pools of its own for the groupbys (see WORKERS_ENV in parallel_groupby.py).
+# The charts are already spread over the cores, one per worker.
+
+def start_render_worker():
+    use_headless_backend()
+    os.environ[WORKERS_ENV] = '0'
+
+
+# chart_jobs() collects the CHARTS list of every script as
+# {output path: (script, function, data files)}.
+# If two charts are saved under the same file name, the later one wins, just like it
+# would when the scripts run from top to bottom.
+
+def chart_jobs(output_dir=OUTPUT_DIR):
+    jobs = {}
+    for module_name in CHART_SCRIPTS:
+        module = importlib.import_module(module_name)
+        for filename, plot_chart, data_paths in module.CHARTS:
+            jobs[os.path.join(output_dir, filename)] = (module_name, plot_chart.__name__, list(data_paths))
+    return jobs
+
+
+# render_key() is the hash a chart is remembered by. Data files are hashed by content
+# (file_digest() from pipeline.py only reads a file again when its size or modification
+# time changed), so cleaning the same data again doesn't redraw anything. A missing data
+# file counts as None, so the chart is drawn again once the file shows up.
+
+def render_key(module_name, function_name, data_paths, memo):
+    import matplotlib as mpl
+
+    code_paths = [os.path.join(CODE_DIR, module_name + '.py')] + [os.path.join(CODE_DIR, name)
+                                                                  for name in SHARED_CHART_CODE]
+    description = {
+        'chart': f'{module_name}.{function_name}',
+        'data': {path: file_digest(path, memo) if os.path.exists(path) else None for path in data_paths},
+        'code': {os.path.basename(path): file_digest(path, memo) for path in code_paths},
+        'matplotlib': mpl.__version__,
+    }
+    encoded = json.dumps(description, sort_keys=True).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+def read_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {'charts': {}, 'file_digests': {}}
+
+
+def write_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+# render_chart() runs in a worker process: it imports the script (the charts only run
+# under "if __name__ == '__main__'", so importing doesn't draw anything) and calls one
+# chart function. It returns how long the chart took, plus the steps it traced (see
+# instrumentation.py) so the main process can put them in its own trace.
+
+def render_chart(module_name, function_name, path):
+    start = time.perf_counter()
+    plot_chart = getattr(importlib.import_module(module_name), function_name)
+    plot_chart(path, show=False)
+    return path, time.perf_counter() - start, take_steps()
+
+
+# render_all() draws the charts whose render key changed and returns
+# (drawn, skipped): a list of (path, seconds) for the charts it drew and a list of the
+# paths it left alone.
+
+def render_all(output_dir=OUTPUT_DIR, workers=None, force=False):
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = read_manifest(output_dir)
+    memo = manifest.get('file_digests', {})
+    charts = manifest.get('charts', {})
+
+    todo, keys, skipped = [], {}, []
+    for path, (module_name, function_name, data_paths) in chart_jobs(output_dir).items():
+        filename = os.path.basename(path)
+        keys[filename] = render_key(module_name, function_name, data_paths, memo)
+        remembered = charts.get(filename)
+        if not force and os.path.exists(path) and remembered and remembered['key'] == keys[filename]:
+            skipped.append(path)
+        else:
+            todo.append((module_name, function_name, path))
+
+    if workers == 0 or not todo:
+        results = [render_chart(module_name, function_name, path) for module_name, function_name, path in todo]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=start_render_worker) as pool:
+            futures = [pool.submit(render_chart, module_name, function_name, path)
+                       for module_name, function_name, path in todo]
+            results = [future.result() for future in futures]
+
+    timings = []
+    for path, seconds, steps in results:
+        add_steps(steps)
+        timings.append((path, seconds))
+        filename = os.path.basename(path)
+        charts[filename] = {'key': keys[filename], 'rendered': datetime.now().isoformat(timespec='seconds'),
+                            'seconds': round(seconds, 3)}
+    # Charts that were taken out of the CHARTS lists are forgotten.
+    manifest = {'charts': {filename: charts[filename] for filename in keys if filename in charts},
+                'file_digests': memo}
+    write_manifest(output_dir, manifest)
+    return timings, skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render every chart into the output folder without a screen.')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help='folder to write the chart images to')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: one per CPU core, 0: no workers)')
+    parser.add_argument('--trace', nargs='?', const='1', default=None, metavar='PATH',
+                        help='record the time and memory of every step as a JSON trace (see instrumentation.py)')
+    parser.add_argument('--force', action='store_true', help='draw every chart, even when its data did not change')
+    args = parser.parse_args()
+    if args.trace:
+        enable_tracing(args.trace)
+
+    start = time.perf_counter()
+    timings, skipped = render_all(args.output_dir, args.workers, args.force)
+    total = time.perf_counter() - start
+
+    for path, seconds in sorted(timings, key=lambda timing: -timing[1]):
+        print(f'{seconds:6.2f}s  {path}')
+    slowest = f' (slowest single chart: {max(seconds for _, seconds in timings):.2f}s)' if timings else ''
+    print(f'{len(timings)} charts rendered in {total:.2f}s{slowest}, {len(skipped)} unchanged and skipped')
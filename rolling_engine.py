@@ -0,0 +1,114 @@
+# Rolling averages for all products at once
+#
+# advanced_analysis.py used to call .rolling(window=30).mean() on one product column
+# at a time, and sales_data_visualizations.py did the same again for the 3-month
+# moving average. Here I compute rolling means for every product and several window
+# lengths together.
+#
+# The trick is a running total (a cumulative sum). If cumsum[t] is the total of all
+# sales up to day t, then the total of the last w days is cumsum[t] - cumsum[t - w],
+# and the w-day average is that divided by w. So one cumsum over the whole
+# days x products table gives me every window length with just one subtraction each.
+#
+# Like pandas' rolling(window).mean(), the first (window - 1) days are NaN, and so is
+# any window that has a missing value in it.
+#
+# OnlineRollingMeans does the same thing for one new day at a time: it keeps the last
+# few days in memory plus a running total per window, so adding a day costs the same
+# no matter how much history there is.
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import traced
+
+DEFAULT_WINDOWS = (7, 30, 90, 365)
+
+
+# daily_matrix() turns row-level data into a days x products table (one row per date,
+# sales added up), which is what the rolling windows run over. With daily data this is
+# just the data sorted by date; with hourly data it adds up the hours of each day.
+
+def daily_matrix(df, products, date_column='datum'):
+    with traced('groupby_daily', rows_in=len(df)) as step:
+        daily = df.groupby(date_column)[list(products)].sum().astype('float64').sort_index()
+        step.rows_out = len(daily)
+    return daily
+
+
+# rolling_means() returns {window: DataFrame of w-day means}, every DataFrame having
+# the same dates and products as 'matrix'.
+
+def rolling_means(matrix, windows=DEFAULT_WINDOWS):
+    values = matrix.to_numpy(dtype='float64')
+    missing = np.isnan(values)
+
+    # I put a row of zeros on top, so that cumsum[t + 1] - cumsum[t + 1 - w] is the
+    # total of rows t - w + 1 .. t, even for the very first full window.
+    zeros = np.zeros((1, values.shape[1]))
+    running_total = np.vstack([zeros, np.cumsum(np.where(missing, 0.0, values), axis=0)])
+    running_missing = np.vstack([zeros, np.cumsum(missing, axis=0)])
+
+    results = {}
+    for window in windows:
+        means = np.full(values.shape, np.nan)
+        if window <= len(values):
+            window_total = running_total[window:] - running_total[:-window]
+            window_missing = running_missing[window:] - running_missing[:-window]
+            means[window - 1:] = np.where(window_missing > 0, np.nan, window_total / window)
+        results[window] = pd.DataFrame(means, index=matrix.index, columns=matrix.columns)
+    return results
+
+
+class OnlineRollingMeans:
+    def __init__(self, products, windows=DEFAULT_WINDOWS):
+        self.products = list(products)
+        self.windows = list(windows)
+        self.longest = max(self.windows)
+        # The last 'longest' days, stored in a circular buffer: 'position' is where the
+        # next day goes, and it wraps around to 0 when it reaches the end.
+        self.buffer = np.zeros((self.longest, len(self.products)))
+        self.buffer_missing = np.zeros((self.longest, len(self.products)), dtype=bool)
+        self.position = 0
+        self.days_seen = 0
+        self.totals = {window: np.zeros(len(self.products)) for window in self.windows}
+        self.missing = {window: np.zeros(len(self.products), dtype=int) for window in self.windows}
+
+    # from_history() warms the engine up with existing data, so the next update() already
+    # has full windows. Only the last 'longest' days matter, so that's all I feed in.
+
+    @classmethod
+    def from_history(cls, matrix, windows=DEFAULT_WINDOWS):
+        engine = cls(matrix.columns, windows)
+        for row in matrix.to_numpy(dtype='float64')[-engine.longest:]:
+            engine.update(row)
+        return engine
+
+    # update() adds one new day (sales for every product, in the same order as
+    # self.products) and returns {window: means for every product}.
+    # For each window, the day that just fell out of the window is subtracted from its
+    # total and the new day is added, so the cost doesn't grow with the history.
+
+    def update(self, day_sales):
+        day_sales = np.asarray(day_sales, dtype='float64')
+        day_missing = np.isnan(day_sales)
+        day_sales = np.where(day_missing, 0.0, day_sales)
+
+        means = {}
+        for window in self.windows:
+            if self.days_seen >= window:
+                leaving = (self.position - window) % self.longest
+                self.totals[window] -= self.buffer[leaving]
+                self.missing[window] -= self.buffer_missing[leaving]
+            self.totals[window] += day_sales
+            self.missing[window] += day_missing
+            if self.days_seen + 1 >= window:
+                means[window] = np.where(self.missing[window] > 0, np.nan, self.totals[window] / window)
+            else:
+                means[window] = np.full(len(self.products), np.nan)
+
+        self.buffer[self.position] = day_sales
+        self.buffer_missing[self.position] = day_missing
+        self.position = (self.position + 1) % self.longest
+        self.days_seen += 1
+        return {window: pd.Series(values, index=self.products) for window, values in means.items()}
@@ -0,0 +1,118 @@
+# Precomputed aggregation cube
+#
+# Every chart script used to add up df['total_sales'] row by row and then run its own
+# groupby: by year+month, by weekday, by hour, and by weekday+hour. All of those are
+# just different ways of adding up the same numbers, so here I add them up once.
+#
+# The cube has one row for every combination of year, month, weekday and hour that
+# appears in the data. Each row holds the sales sum of every product for that
+# combination, plus 'row_count' (how many rows of data fell into it).
+# analysis.py builds the cube while it cleans (chunk by chunk) and saves it to
+# 02_data_clean/sales_cube.csv.
+#
+# Any chart grouping can be answered from the cube by "rolling up": grouping the cube
+# by fewer dimensions and adding the sums and counts together. Means work too, because
+# mean = (sum of sales) / (number of rows), and both of those add up correctly.
+
+import os
+
+import pandas as pd
+
+from instrumentation import traced
+from parallel_groupby import parallel_groupby
+from sales_store import CLEAN_CSV_PATH, TYPED_STORE_PATH, WEEKDAY_DTYPE, product_columns_in
+
+CUBE_PATH = '02_data_clean/sales_cube.csv'
+CUBE_DIMENSIONS = ['year', 'month', 'weekday_name', 'hour']
+COUNT_COLUMN = 'row_count'
+
+
+def cube_product_columns(cube):
+    return [column for column in cube.columns if column not in CUBE_DIMENSIONS + [COUNT_COLUMN]]
+
+
+# build_cube() turns row-level data (one cleaned chunk, or the whole dataset) into a cube.
+# Every column that isn't a calendar column is treated as a product. I add the sums up
+# as float64 so that rounding doesn't build up over millions of float32 rows.
+# The products are converted to float64 as one block, not column by column, so with
+# thousands of products pandas doesn't end up juggling thousands of separate arrays.
+
+def build_cube(df):
+    with traced('groupby_cube', rows_in=len(df)) as step:
+        product_columns = product_columns_in(df.columns)
+        sales = pd.DataFrame(df[product_columns].to_numpy(dtype='float64'), index=df.index, columns=product_columns)
+        grouped = sales.groupby([df[dimension] for dimension in CUBE_DIMENSIONS], observed=True, sort=False)
+        cube = pd.concat([grouped.sum(), grouped.size().rename(COUNT_COLUMN)], axis=1)
+        cube = cube.reset_index()
+        step.rows_out = len(cube)
+    return cube
+
+
+# merge_cubes() adds several cubes together, for example the cube built so far and the
+# cube of the next chunk. Because everything in the cube is a sum or a count, adding
+# them per calendar combination gives exactly the cube of all the data together.
+
+def merge_cubes(cubes):
+    cubes = [cube for cube in cubes if cube is not None]
+    with traced('merge_cubes', rows_in=sum(len(cube) for cube in cubes)) as step:
+        combined = pd.concat(cubes, ignore_index=True)
+        merged = combined.groupby(CUBE_DIMENSIONS, observed=True).sum().reset_index()
+        step.rows_out = len(merged)
+    return merged
+
+
+# rollup() answers a chart's question from the cube.
+# by: the dimensions I want to keep, e.g. ['year', 'month'] or ['weekday_name', 'hour'].
+#     An empty list adds up everything into one row.
+# products: which products to include (all of them by default).
+# how: 'sum' for totals, 'mean' for the average per row of data (like groupby().mean()).
+# The result has one column per product plus 'total_sales' (all the chosen products
+# added together).
+
+def rollup(cube, by, products=None, how='sum'):
+    if products is None:
+        products = cube_product_columns(cube)
+    products = list(products)
+    if how not in ('sum', 'mean'):
+        raise ValueError(f"how must be 'sum' or 'mean', not {how!r}")
+    with traced('groupby_rollup', rows_in=len(cube)) as step:
+        if by:
+            grouped = cube.groupby(list(by), observed=True)[products + [COUNT_COLUMN]].sum()
+        else:
+            grouped = cube[products + [COUNT_COLUMN]].sum().to_frame().T
+        grouped['total_sales'] = grouped[products].sum(axis=1)
+        counts = grouped.pop(COUNT_COLUMN)
+        if how == 'mean':
+            grouped = grouped.div(counts, axis=0)
+        step.rows_out = len(grouped)
+    return grouped
+
+
+def save_cube(cube, path=CUBE_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    cube.to_csv(path, index=False)
+
+
+# rebuild_cube() builds the same cube straight from the cleaned data, with the row-level
+# groupby spread over worker processes (see parallel_groupby.py). The cube only needs
+# sums and row counts per group, and both merge exactly between workers.
+
+def rebuild_cube(workers=None, store_path=TYPED_STORE_PATH, csv_path=CLEAN_CSV_PATH):
+    aggregated = parallel_groupby(CUBE_DIMENSIONS, None, ('sum', 'size'), workers,
+                                  store_path=store_path, csv_path=csv_path)
+    cube = aggregated.xs('sum', axis=1, level=1)
+    cube[COUNT_COLUMN] = aggregated[('size', '')].to_numpy()
+    return cube.reset_index()
+
+
+# load_cube() reads the saved cube. If analysis.py hasn't saved one yet (for example the
+# data was cleaned with an older version), I build it from the cleaned data instead.
+
+def load_cube(path=CUBE_PATH):
+    if not os.path.exists(path):
+        return rebuild_cube()
+    cube = pd.read_csv(path)
+    cube['weekday_name'] = cube['weekday_name'].astype(WEEKDAY_DTYPE)
+    # read_csv keeps every column as its own array; copy() packs the product sums
+    # together, which keeps roll-ups over thousands of products quick.
+    return cube.copy()
@@ -0,0 +1,317 @@
+# Shared loader for the cleaned sales data
+#
+# All the analysis scripts used to read 02_data_clean/sales_data_clean.csv from text,
+# which means pandas had to guess every column type again and re-parse 'datum' as a
+# plain string on every run. Here I keep a second, typed copy of the cleaned data in
+# Arrow format next to the CSV, and every script loads the data through load_sales().
+#
+# The typed copy is a folder of Arrow IPC files (one "part" per chunk the cleaner
+# wrote). Arrow files can be memory-mapped, so opening them doesn't copy the data,
+# and when a script only asks for a few columns, only those columns are read.
+#
+# pyarrow is optional. If it's not installed, the cleaner skips the typed copy and
+# load_sales() falls back to reading the CSV and fixing the types itself.
+
+import argparse
+import glob
+import os
+import re
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import traced
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = None
+
+CLEAN_CSV_PATH = '02_data_clean/sales_data_clean.csv'
+TYPED_STORE_PATH = '02_data_clean/sales_data_clean.arrow'
+
+# These are the columns that tell me *when* a sale happened. Everything else in the
+# cleaned data is a product column.
+CALENDAR_COLUMNS = ['datum', 'year', 'month', 'hour', 'weekday_name']
+ORDERED_DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+WEEKDAY_DTYPE = pd.CategoricalDtype(ORDERED_DAYS, ordered=True)
+
+
+# The product columns used to be a hard-coded list of our 8 ATC codes, copied into
+# every chart script. Our real catalog has thousands of products, so instead every
+# column that isn't a calendar column counts as a product.
+# product_columns_in() picks them out of a list of column names, and discover_products()
+# reads them from the cleaned data's header (only the header, not the rows).
+
+def product_columns_in(columns):
+    return [column for column in columns if column not in CALENDAR_COLUMNS]
+
+
+def discover_products(store_path=TYPED_STORE_PATH, csv_path=CLEAN_CSV_PATH):
+    if typed_store_available(store_path):
+        first_part = store_parts(store_path)[0]
+        columns = pa.ipc.open_file(pa.memory_map(first_part, 'r')).schema.names
+    else:
+        columns = pd.read_csv(csv_path, nrows=0).columns
+    return product_columns_in(columns)
+
+
+# Here I give the cleaned data its proper types, as small as they can be:
+# product sales become float32 (plenty of precision for sales volumes, half the size),
+# year/month/hour become the smallest whole-number type their values fit in (int8 holds
+# -128..127, int16 -32768..32767), weekday_name becomes a category with the days in
+# Monday-to-Sunday order, and datum becomes a real datetime.
+#
+# Squeezing a number into a type that's too small doesn't give an error, it silently
+# "wraps around" (300 stored as int8 comes back as 44). So every column is checked
+# first: smallest_int_type() looks at the lowest and highest value, and float_type()
+# only picks float32 if the biggest sale fits in it, otherwise the column stays float64.
+# 'hour' in our export goes up to about 280, for example, so it becomes int16, not int8.
+#
+# Every part gets exactly the same weekday categories, so the parts can be stacked
+# back together without pandas having to merge different category lists.
+# All the product columns are converted together in one go, so they end up as one
+# block of memory instead of thousands of separate columns.
+
+def smallest_int_type(values):
+    if len(values) == 0:
+        return 'int8'
+    low, high = values.min(), values.max()
+    for dtype in ('int8', 'int16', 'int32'):
+        if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+            return dtype
+    return 'int64'
+
+
+def float_type(values):
+    largest = np.nanmax(np.abs(values)) if values.size else 0
+    return 'float32' if largest <= np.finfo('float32').max else 'float64'
+
+
+def to_typed_frame(df):
+    products = product_columns_in(df.columns)
+    types = {}
+    for column in df.columns:
+        if column in ('year', 'month', 'hour'):
+            types[column] = smallest_int_type(df[column].to_numpy())
+        elif column == 'weekday_name':
+            types[column] = WEEKDAY_DTYPE
+    calendar = df.drop(columns=products).astype(types)
+    if 'datum' in calendar.columns:
+        calendar['datum'] = pd.to_datetime(calendar['datum'])
+    sales = df[products].to_numpy()
+    sales = pd.DataFrame(sales.astype(float_type(sales), copy=False), index=df.index, columns=products)
+    return pd.concat([calendar, sales], axis=1)[list(df.columns)]
+
+
+# memory_report() compares the memory a loaded frame uses with what the same data took
+# with the types the scripts used to get: 8 bytes for every number and date (float64,
+# int64, datetime64), and for weekday_name a pointer plus a separate Python string on
+# every row. All the product columns share one line, there can be thousands of them.
+
+def memory_report(df):
+    products = product_columns_in(df.columns)
+    lines = []
+    for label, columns in [(column, [column]) for column in df.columns if column not in products] + \
+            [(f'{len(products)} products', products)]:
+        if not columns:
+            continue
+        before = 0
+        for column in columns:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                counts = df[column].value_counts(sort=False)
+                before += 8 * len(df) + sum(sys.getsizeof(str(value)) * count for value, count in counts.items())
+            else:
+                before += 8 * len(df)
+        after = int(df[columns].memory_usage(index=False, deep=True).sum())
+        dtypes = sorted({str(df[column].dtype) for column in columns})
+        lines.append({'columns': label, 'dtype': '/'.join(dtypes), 'before_mb': before / 2**20,
+                      'after_mb': after / 2**20})
+    report = pd.DataFrame(lines).set_index('columns')
+    report.loc['total'] = ['', report['before_mb'].sum(), report['after_mb'].sum()]
+    return report
+
+
+def print_memory_report(df):
+    report = memory_report(df)
+    print(f'Memory of {len(df)} rows x {len(df.columns)} columns (before: float64/int64 and Python strings, after: as loaded):')
+    print(report.to_string(float_format=lambda mb: f'{mb:10.2f}'))
+    before, after = report.loc['total', 'before_mb'], report.loc['total', 'after_mb']
+    if after:
+        print(f'{before:.1f} MB -> {after:.1f} MB ({before / after:.1f}x smaller)')
+
+
+# The typed copy is partitioned by month, "Hive style": every part lives in a folder
+# named after its year and month, for example
+#   02_data_clean/sales_data_clean.arrow/year=2019/month=3/part-00004.arrow
+# so a script that only wants 2019 only opens the 2019 folders and never touches the
+# rest (this is called partition pruning). Each cleaned chunk is split by month, and
+# the incremental mode of analysis.py just adds new part files to the month folders.
+# Stores written before the partitioning (part files straight in the store folder)
+# are still read, they just can't be skipped.
+
+PARTITION_PATTERN = re.compile(r'year=(-?\d+)[\\/]month=(\d+)[\\/]part-(\d+)\.arrow$')
+
+
+def typed_store_available(store_path=TYPED_STORE_PATH):
+    return pa is not None and bool(store_parts(store_path))
+
+
+# store_parts() lists the part files to read, oldest month first, leaving out every
+# month that lies completely outside start..end.
+
+def store_parts(store_path=TYPED_STORE_PATH, start=None, end=None):
+    start = None if start is None else pd.Timestamp(start)
+    end = None if end is None else pd.Timestamp(end)
+    parts = [((0, 0, 0), part_path) for part_path in glob.glob(os.path.join(store_path, '*.arrow'))]
+    for part_path in glob.glob(os.path.join(store_path, 'year=*', 'month=*', 'part-*.arrow')):
+        match = PARTITION_PATTERN.search(part_path)
+        if match is None:
+            continue
+        year, month, part_number = (int(number) for number in match.groups())
+        month_start = pd.Timestamp(year=year, month=month, day=1)
+        if end is not None and month_start > end:
+            continue
+        if start is not None and month_start + pd.offsets.MonthBegin(1) <= start:
+            continue
+        parts.append(((year, month, part_number), part_path))
+    return [part_path for _, part_path in sorted(parts)]
+
+
+# The cleaner calls clear_typed_store() once before a full clean, then
+# write_typed_part() for every cleaned chunk.
+
+def clear_typed_store(store_path=TYPED_STORE_PATH):
+    if os.path.isdir(store_path):
+        shutil.rmtree(store_path)
+
+
+def write_typed_part(df, part_number, store_path=TYPED_STORE_PATH):
+    if pa is None:
+        return None
+    part_paths = []
+    typed = to_typed_frame(df)
+    for (year, month), month_rows in typed.groupby(['year', 'month'], sort=True):
+        folder = os.path.join(store_path, f'year={year}', f'month={month}')
+        os.makedirs(folder, exist_ok=True)
+        table = pa.Table.from_pandas(month_rows, preserve_index=False)
+        part_path = os.path.join(folder, f'part-{part_number:05d}.arrow')
+        with pa.OSFile(part_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        part_paths.append(part_path)
+    return part_paths
+
+
+# These two work out what to read for a request:
+# - products is a shortcut for "the calendar columns plus these products";
+# - with a date range I also need 'datum' to filter the rows, even if the caller
+#   didn't ask for it (it's dropped again afterwards).
+
+def requested_columns(columns=None, products=None):
+    if products is None:
+        return None if columns is None else list(columns)
+    columns = CALENDAR_COLUMNS if columns is None else list(columns)
+    return columns + [product for product in products if product not in columns]
+
+
+def read_store_part(part_path, columns=None, start=None, end=None):
+    table = pa.ipc.open_file(pa.memory_map(part_path, 'r')).read_all()
+    filtering = start is not None or end is not None
+    if columns is not None:
+        table = table.select(list(columns) + (['datum'] if filtering and 'datum' not in columns else []))
+    if filtering:
+        datum = table.column('datum')
+        keep = None
+        for bound, compare in ((start, pc.greater_equal), (end, pc.less_equal)):
+            if bound is not None:
+                test = compare(datum, pa.scalar(pd.Timestamp(bound), type=datum.type))
+                keep = test if keep is None else pc.and_(keep, test)
+        table = table.filter(keep)
+        if columns is not None and 'datum' not in columns:
+            table = table.drop_columns(['datum'])
+    return table
+
+
+def filter_dates(df, start=None, end=None):
+    if start is not None:
+        df = df[df['datum'] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df['datum'] <= pd.Timestamp(end)]
+    return df
+
+
+# iter_sales() gives the cleaned data one piece at a time (one store part, or one
+# chunk of the CSV), for work that doesn't need all the rows in memory at once, like
+# adding up correlation stats over thousands of products.
+
+def iter_sales(columns=None, store_path=TYPED_STORE_PATH, csv_path=CLEAN_CSV_PATH, chunksize=100_000,
+               start=None, end=None, products=None):
+    columns = requested_columns(columns, products)
+    if typed_store_available(store_path):
+        for part_path in store_parts(store_path, start, end):
+            yield read_store_part(part_path, columns, start, end).to_pandas()
+        return
+    for df in read_clean_csv(csv_path, columns, start, end, chunksize):
+        yield df
+
+
+# Without the typed copy I read the CSV (in chunks, if asked) and filter the dates
+# afterwards, because a CSV can't be skipped through by month.
+
+def read_clean_csv(csv_path=CLEAN_CSV_PATH, columns=None, start=None, end=None, chunksize=None):
+    filtering = start is not None or end is not None
+    read_columns = columns
+    if columns is not None and filtering and 'datum' not in columns:
+        read_columns = list(columns) + ['datum']
+    chunks = pd.read_csv(csv_path, usecols=read_columns, chunksize=chunksize)
+    for chunk in [chunks] if chunksize is None else chunks:
+        df = filter_dates(to_typed_frame(chunk if read_columns is None else chunk[read_columns]), start, end)
+        yield df if columns is None else df[list(columns)]
+
+
+# load_sales() is what every script uses to get the cleaned data.
+# columns lets a script ask for just the columns it needs (for example only the
+# product columns and 'year'/'month'), so the rest never gets loaded.
+# products is the same thing for products: the calendar columns plus these products.
+# start/end keep only the rows from start to end (both included, anything
+# pd.Timestamp() understands, like '2019-01-01'). With the typed copy, only the months
+# in that range are opened at all.
+# If the typed Arrow copy is there, I memory-map each part and pick out the columns;
+# otherwise I read the CSV and give it the same types, so the scripts always get the
+# same kind of DataFrame back.
+# Parts can have different whole-number types (a month where 'hour' fits in int8 next to
+# one that needs int16), so stacking them widens every column to the biggest type used.
+# With report_memory=True it also prints how much memory the compact types save.
+
+def load_sales(columns=None, store_path=TYPED_STORE_PATH, csv_path=CLEAN_CSV_PATH, start=None, end=None,
+               products=None, report_memory=False):
+    columns = requested_columns(columns, products)
+    if typed_store_available(store_path):
+        with traced('load_typed_store') as step:
+            tables = [read_store_part(part_path, columns, start, end)
+                      for part_path in store_parts(store_path, start, end)]
+            if not tables:
+                # Nothing in that date range: an empty table with the right columns.
+                tables = [read_store_part(store_parts(store_path)[0], columns).slice(0, 0)]
+            df = pa.concat_tables(tables, promote_options='permissive').to_pandas()
+            step.rows_out = len(df)
+    else:
+        with traced('read_csv_clean') as step:
+            df = next(read_clean_csv(csv_path, columns, start, end))
+            step.rows_out = len(df)
+    if report_memory:
+        print_memory_report(df)
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load the cleaned sales data and report its memory use.')
+    parser.add_argument('--products', nargs='*', default=None, help='products to load (default: all)')
+    parser.add_argument('--start', default=None, help='first date to load, e.g. 2019-01-01')
+    parser.add_argument('--end', default=None, help='last date to load')
+    args = parser.parse_args()
+    load_sales(products=args.products, start=args.start, end=args.end, report_memory=True)
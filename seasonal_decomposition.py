@@ -0,0 +1,216 @@
+# Splitting every product's daily sales into trend + weekly + yearly + the rest
+#
+# The "Moving Averages & Seasonality" step in advanced_analysis.py draws a 30-day rolling
+# mean, and whether a product is seasonal is then judged by eye. This file splits each
+# product's daily sales into four parts that add up to the original:
+#
+#   sales = trend + weekly + yearly + residual
+#
+# - trend: the slow movement over months and years,
+# - weekly: how much every weekday sells above or below normal (the same every week),
+# - yearly: how much every time of the year sells above or below normal (the same every
+#   year, e.g. more painkillers in winter),
+# - residual: what's left, the day-to-day noise plus one-off spikes.
+#
+# It works like STL/MSTL decomposition, kept simple:
+#   1. trend = centered 365-day average (a full year, so the seasons cancel out)
+#   2. weekly = average of (sales - trend) per weekday
+#      yearly = average of (sales - trend - weekly) per day of the year, smoothed over
+#               a few weeks (with 6 years there are only 6 values per day)
+#   3. trend again, now as a centered TREND_DAYS average of (sales - weekly - yearly)
+#   4. steps 2 and 3 once more with the better trend, and residual = what's left.
+# Every step works on the whole days x products table at once (numpy and pandas work
+# down all the columns together), so thousands of products take seconds, not a Python
+# loop per product. Products are done in blocks of BLOCK_PRODUCTS to limit memory.
+#
+# The results are cached in 02_data_clean/seasonal_decomposition.npz per product, under
+# a fingerprint of that product's own daily series (its dates and numbers) and the
+# decomposition settings. A rerun only decomposes the products whose fingerprint changed;
+# the others come straight from the cache, lined up with today's dates. There is no key
+# for the file as a whole, so a product whose series didn't change keeps its entry even
+# when the other products' series or the number of days did. (Appending days does change
+# the series of every product that got them: the trend and the patterns are taken over
+# the whole series, so those products are decomposed again.)
+#
+# Usage:
+#   python seasonal_decomposition.py                       # strongest seasonal products
+#   python seasonal_decomposition.py --products m01ab n02be
+
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from backends import get_backend
+from instrumentation import traced
+from sales_store import discover_products
+
+DECOMPOSITION_PATH = '02_data_clean/seasonal_decomposition.npz'
+COMPONENTS = ('trend', 'weekly', 'yearly', 'residual')
+TREND_DAYS = 91
+YEARLY_SMOOTHING_DAYS = 15
+ITERATIONS = 2
+BLOCK_PRODUCTS = 500
+
+
+# centered_mean() is a centered moving average down every column: the mean of the
+# 'window' days around each day. Near the start and the end the window is cut off
+# (fewer days are averaged) instead of leaving the edges empty, and empty days (NaN)
+# are left out of the average.
+
+def centered_mean(values, window):
+    present = ~np.isnan(values)
+    zeros = np.zeros((1, values.shape[1]))
+    running_total = np.vstack([zeros, np.cumsum(np.where(present, values, 0.0), axis=0)])
+    running_count = np.vstack([zeros, np.cumsum(present, axis=0)])
+    rows = np.arange(len(values))
+    low = np.clip(rows - window // 2, 0, len(values))
+    high = np.clip(rows + window - window // 2, 0, len(values))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (running_total[high] - running_total[low]) / (running_count[high] - running_count[low])
+
+
+# seasonal_profile() averages 'values' per label (weekday or day of the year) and gives
+# every day the average of its label, shifted so the profile averages to 0 (the level
+# belongs to the trend). With smoothing, neighbouring labels are averaged too, wrapping
+# around from the end of the year to the start.
+
+def seasonal_profile(values, labels, size, smoothing=None):
+    profile = pd.DataFrame(values).groupby(labels).mean().reindex(range(size)).to_numpy()
+    if smoothing:
+        wrapped = np.vstack([profile[-smoothing:], profile, profile[:smoothing]])
+        profile = centered_mean(wrapped, smoothing)[smoothing:-smoothing]
+    profile = profile - np.nanmean(profile, axis=0)
+    return np.nan_to_num(profile)[labels]
+
+
+# decompose() splits a days x products DataFrame of daily sales into the four parts,
+# each a DataFrame of the same shape. Missing days are added as empty (NaN) rows first,
+# so "365 rows" always means a year.
+
+def decompose(daily, trend_days=TREND_DAYS, iterations=ITERATIONS):
+    daily = daily.asfreq('D') if len(daily) else daily
+    values = daily.to_numpy(dtype='float64')
+    weekday = daily.index.dayofweek.to_numpy()
+    day_of_year = daily.index.dayofyear.to_numpy() - 1
+    has_years = len(daily) >= 2 * 365
+
+    trend = centered_mean(values, 365 if has_years else 7)
+    weekly = yearly = np.zeros_like(values)
+    for _ in range(iterations):
+        weekly = seasonal_profile(values - trend, weekday, 7)
+        if has_years:
+            yearly = seasonal_profile(values - trend - weekly, day_of_year, 366, YEARLY_SMOOTHING_DAYS)
+        trend = centered_mean(values - weekly - yearly, trend_days)
+    residual = values - trend - weekly - yearly
+    return {name: pd.DataFrame(component, index=daily.index, columns=daily.columns)
+            for name, component in zip(COMPONENTS, (trend, weekly, yearly, residual))}
+
+
+# series_versions() is the "data version" of every product: a fingerprint of the
+# decomposition settings, the dates its series covers and its daily numbers, so a
+# product whose series didn't change keeps its cached decomposition.
+
+def series_versions(daily, trend_days, iterations):
+    settings = json.dumps({'first': str(daily.index[0]) if len(daily) else None, 'trend_days': trend_days,
+                           'iterations': iterations, 'yearly_smoothing': YEARLY_SMOOTHING_DAYS}).encode()
+    values = np.ascontiguousarray(daily.to_numpy(dtype='float64').T)
+    return [hashlib.blake2b(settings + column.tobytes(), digest_size=12).hexdigest() for column in values]
+
+
+# The cache holds the components of every product on one shared row of dates ('dates').
+# A product whose series is shorter than the others is NaN on the days it doesn't have.
+
+def read_cache(path):
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as saved:
+        if 'dates' not in saved.files:
+            return None
+        return {name: saved[name] for name in saved.files}
+
+
+# load_decomposition() is what the charts use. It returns {component: DataFrame} for
+# the products asked for (all of them by default), decomposing only the products whose
+# daily sales changed since the cached run.
+
+def load_decomposition(products=None, path=DECOMPOSITION_PATH, trend_days=TREND_DAYS, iterations=ITERATIONS):
+    products = discover_products() if products is None else list(products)
+    daily = get_backend().daily_totals(products)[products]
+    daily = daily.asfreq('D') if len(daily) else daily
+    versions = series_versions(daily, trend_days, iterations)
+
+    cached = read_cache(path)
+    cached_columns = {}
+    if cached is not None:
+        for position, (product, version) in enumerate(zip(cached['products'].tolist(), cached['versions'].tolist())):
+            cached_columns[product] = (version, position)
+        # rows[i] is the row of the cache that holds today's i-th day (-1: not in the cache).
+        rows = pd.DatetimeIndex(cached['dates']).get_indexer(daily.index)
+
+    components = {name: np.empty(daily.shape, dtype='float32') for name in COMPONENTS}
+    stale = []
+    for position, (product, version) in enumerate(zip(products, versions)):
+        remembered = cached_columns.get(product)
+        if remembered is not None and remembered[0] == version and (rows >= 0).all():
+            for name in COMPONENTS:
+                components[name][:, position] = cached[name][rows, remembered[1]]
+        else:
+            stale.append(position)
+
+    with traced('seasonal_decomposition', rows_in=len(stale)) as step:
+        for block_start in range(0, len(stale), BLOCK_PRODUCTS):
+            block = stale[block_start:block_start + BLOCK_PRODUCTS]
+            parts = decompose(daily.iloc[:, block], trend_days, iterations)
+            for name in COMPONENTS:
+                components[name][:, block] = parts[name].to_numpy(dtype='float32')
+        step.rows_out = len(stale)
+
+    if stale:
+        # The cache keeps every product it has seen, not only the ones asked for this
+        # time. If those were cached on other dates, the shared dates become the union.
+        asked = set(products)
+        keep = [product for product in cached_columns if product not in asked]
+        dates = daily.index
+        saved = {name: components[name] for name in COMPONENTS}
+        if keep:
+            dates = dates.union(pd.DatetimeIndex(cached['dates']))
+            keep_positions = [cached_columns[product][1] for product in keep]
+            saved = {name: np.hstack([pd.DataFrame(saved[name], index=daily.index).reindex(dates).to_numpy(),
+                                      pd.DataFrame(cached[name][:, keep_positions], index=cached['dates'])
+                                      .reindex(dates).to_numpy()]).astype('float32')
+                     for name in COMPONENTS}
+            versions = versions + [cached_columns[product][0] for product in keep]
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, dates=dates.to_numpy(dtype='datetime64[ns]'), products=np.array(products + keep),
+                 versions=np.array(versions), **saved)
+
+    return {name: pd.DataFrame(components[name], index=daily.index, columns=products) for name in COMPONENTS}
+
+
+# seasonal_strength() says, per product, how much of the variation the weekly and the
+# yearly pattern explain: 1 - var(residual) / var(pattern + residual), cut off at 0.
+# Close to 1 means a clear pattern, close to 0 means none worth mentioning.
+
+def seasonal_strength(decomposition):
+    residual = decomposition['residual']
+    strength = {}
+    for name in ('weekly', 'yearly'):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            strength[name] = (1 - residual.var() / (decomposition[name] + residual).var()).clip(lower=0)
+    return pd.DataFrame(strength)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Decompose every product into trend, weekly, yearly and residual.')
+    parser.add_argument('--products', nargs='*', default=None, help='products to decompose (default: all)')
+    parser.add_argument('--top', type=int, default=10, help='how many of the most seasonal products to list')
+    args = parser.parse_args()
+
+    strength = seasonal_strength(load_decomposition(args.products))
+    for name in ('weekly', 'yearly'):
+        print(f'\nStrongest {name} pattern:')
+        print(strength[name].sort_values(ascending=False).head(args.top).round(3).to_string())
@@ -0,0 +1,113 @@
+# Make a big fake sales file with the same layout as sales_data.csv
+#
+# The real sales_data.csv only has about 2,000 rows and 8 products, which is far too
+# small to see how the scripts behave on our real exports (millions of rows, hundreds
+# of products). This script writes a file with exactly the same columns and formats:
+#
+#   datum (M/D/YYYY) | one column per product (ATC codes) | Year | Month | Hour | Weekday Name
+#
+# The sales numbers are random but look a bit like the real ones: every product has its
+# own typical level, a weekly pattern and a yearly pattern, and values are rounded to
+# 2 decimals and never negative.
+# The rows are spread evenly over the days, with a random Hour for each row.
+# To give the cleaning step real work to do, some rows have an empty product value (NaN)
+# and some rows are written twice (exact duplicates).
+#
+# The first 8 products are the real ATC codes from sales_data.csv, so the chart scripts
+# still find the products they expect. The rest get made-up codes in the same style.
+#
+# Usage:
+#   python synthetic_sales_data.py --rows 10000000 --products 300 --output synthetic_sales_data.csv
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+REAL_PRODUCTS = ['M01AB', 'M01AE', 'N02BA', 'N02BE', 'N05B', 'N05C', 'R03', 'R06']
+
+
+# product_codes() returns n product column names: the real 8 first, then made-up
+# ATC-looking codes such as 'A03BC' (letter, 2 digits, 2 letters).
+
+def product_codes(n):
+    codes = REAL_PRODUCTS[:n]
+    letters = 'ABCDGHJLMNPRSV'
+    number = 0
+    while len(codes) < n:
+        code = (letters[number % len(letters)] + f'{(number // len(letters)) % 100:02d}'
+                + 'ABCDEFGH'[(number // 1400) % 8] + 'ABCDEFGH'[(number // 11200) % 8])
+        if code not in codes:
+            codes.append(code)
+        number += 1
+    return codes
+
+
+# generate_chunks() yields the fake raw data as DataFrames of at most chunk_rows rows,
+# so a 10M-row file never has to be in memory at once.
+#   rows: how many rows to make (before adding duplicates)
+#   products: how many product columns
+#   days: how many days the rows are spread over, starting on 2 January 2014 like the real file
+#   nan_rate: share of rows where one product value is left empty
+#   duplicate_rate: share of rows that are written a second time
+
+def generate_chunks(rows, products=8, days=2190, nan_rate=0.001, duplicate_rate=0.001,
+                    seed=0, chunk_rows=500_000):
+    rng = np.random.default_rng(seed)
+    columns = product_codes(products)
+    dates = pd.date_range('2014-01-02', periods=days, freq='D')
+    date_text = np.array([f'{d.month}/{d.day}/{d.year}' for d in dates], dtype=object)
+    weekday_names = np.array(dates.day_name(), dtype=object)
+
+    # Every product gets its own level and its own weekly/yearly swing.
+    level = rng.gamma(2.0, 4.0, size=products)
+    weekly = 1 + rng.uniform(0, 0.3, size=products) * np.sin(2 * np.pi * np.arange(days)[:, None] / 7)
+    yearly = 1 + rng.uniform(0, 0.4, size=products) * np.cos(2 * np.pi * np.arange(days)[:, None] / 365.25)
+    day_shape = weekly * yearly
+
+    for start in range(0, rows, chunk_rows):
+        count = min(chunk_rows, rows - start)
+        day = (np.arange(start, start + count) * days) // rows
+        sales = rng.poisson(level * day_shape[day]).astype('float64')
+        sales += np.round(rng.uniform(0, 1, size=sales.shape), 2) * (rng.uniform(size=sales.shape) < 0.3)
+        missing = np.flatnonzero(rng.uniform(size=count) < nan_rate)
+        sales[missing, rng.integers(0, products, size=len(missing))] = np.nan
+
+        chunk = pd.DataFrame(sales, columns=columns)
+        chunk.insert(0, 'datum', date_text[day])
+        chunk['Year'] = dates.year.to_numpy()[day]
+        chunk['Month'] = dates.month.to_numpy()[day]
+        chunk['Hour'] = rng.integers(0, 24, size=count)
+        chunk['Weekday Name'] = weekday_names[day]
+
+        # Duplicates are written right after the original row, the way a retried export
+        # repeats lines.
+        repeat = 1 + (rng.uniform(size=count) < duplicate_rate)
+        yield chunk.loc[chunk.index.repeat(repeat)]
+
+
+def write_sales_data(path, rows, products=8, days=2190, nan_rate=0.001, duplicate_rate=0.001, seed=0,
+                     chunk_rows=500_000):
+    written = 0
+    for number, chunk in enumerate(generate_chunks(rows, products, days, nan_rate, duplicate_rate,
+                                                   seed, chunk_rows)):
+        chunk.to_csv(path, mode='w' if number == 0 else 'a', header=number == 0, index=False,
+                     float_format='%.10g')
+        written += len(chunk)
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a fake raw sales file with the sales_data.csv layout.')
+    parser.add_argument('--output', default='synthetic_sales_data.csv', help='where to write the CSV')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='number of rows (before duplicates)')
+    parser.add_argument('--products', type=int, default=100, help='number of product columns')
+    parser.add_argument('--days', type=int, default=2190, help='number of days the rows cover')
+    parser.add_argument('--nan-rate', type=float, default=0.001, help='share of rows with an empty product value')
+    parser.add_argument('--duplicate-rate', type=float, default=0.001, help='share of rows written twice')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (same seed, same file)')
+    args = parser.parse_args()
+
+    written = write_sales_data(args.output, args.rows, args.products, args.days, args.nan_rate,
+                               args.duplicate_rate, args.seed)
+    print(f'Wrote {written} rows x {args.products} products to {args.output}')
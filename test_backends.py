@@ -0,0 +1,94 @@
+# Checks that every backend in backends.py gives the same answers as pandas
+#
+# The data is a small made-up cleaned table (three products, a few months of hourly
+# rows), written to a temporary folder both as the typed Arrow store and as the clean
+# CSV. Every backend is then compared with pandas through check_backend(), once on the
+# store and once on the CSV alone. Polars and DuckDB are skipped when they're not
+# installed.
+#
+# Usage:
+#   python -m pytest -q test_backends.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backends import check_backend, get_backend
+from sales_store import write_typed_part
+
+PRODUCTS = ['m01ab', 'n02be', 'r03']
+
+
+def cleaned_frame(days=120):
+    rng = np.random.default_rng(7)
+    dates = pd.date_range('2019-11-01', periods=days * 24, freq='h')
+    df = pd.DataFrame({'datum': dates.floor('D')})
+    for product in PRODUCTS:
+        df[product] = rng.gamma(2.0, 1.7, len(df)).round(2)
+    df['year'] = dates.year
+    df['month'] = dates.month
+    df['hour'] = dates.hour
+    df['weekday_name'] = dates.day_name()
+    return df
+
+
+@pytest.fixture(scope='module')
+def paths(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('sales')
+    df = cleaned_frame()
+    csv_path = str(folder / 'sales_data_clean.csv')
+    store_path = str(folder / 'sales_data_clean.arrow')
+    df.to_csv(csv_path, index=False)
+    pytest.importorskip('pyarrow')
+    write_typed_part(df, 0, store_path)
+    return store_path, csv_path, str(folder / 'no_store.arrow')
+
+
+@pytest.mark.parametrize('name', ['polars', 'duckdb'])
+@pytest.mark.parametrize('source', ['store', 'csv'])
+def test_backend_matches_pandas(paths, name, source):
+    pytest.importorskip(name)
+    store_path, csv_path, missing_store = paths
+    store_path = store_path if source == 'store' else missing_store
+    results = check_backend(get_backend(name, store_path, csv_path), get_backend('pandas', store_path, csv_path))
+    assert [check for check, same in results if not same] == []
+
+
+@pytest.mark.parametrize('name', ['pandas', 'polars', 'duckdb'])
+@pytest.mark.parametrize('source', ['store', 'csv'])
+def test_empty_date_range(paths, name, source):
+    pytest.importorskip(name)
+    store_path, csv_path, missing_store = paths
+    backend = get_backend(name, store_path if source == 'store' else missing_store, csv_path)
+
+    totals = backend.totals(['year', 'month'], start='2030-01-01', end='2030-12-31')
+    assert len(totals) == 0
+    assert list(totals.columns) == PRODUCTS + ['total_sales']
+    assert list(totals.index.names) == ['year', 'month']
+
+    daily = backend.daily_totals(start='2030-01-01', end='2030-12-31')
+    assert len(daily) == 0
+    assert isinstance(daily.index, pd.DatetimeIndex)
+
+
+def test_date_range_totals_match_pandas(paths):
+    store_path, csv_path, missing_store = paths
+    expected = get_backend('pandas', store_path, csv_path).totals(['month'], start='2019-12-15', end='2020-01-20')
+    got = get_backend('pandas', missing_store, csv_path).totals(['month'], start='2019-12-15', end='2020-01-20')
+    assert list(expected.index) == [1, 12]
+    np.testing.assert_allclose(got.to_numpy(), expected.to_numpy(), rtol=1e-9)
+
+
+# With SALES_WORKERS=0 (what render_all.py sets in its chart processes) the pandas
+# backend must not start a process pool of its own.
+def test_workers_setting_keeps_groupby_in_process(paths, monkeypatch):
+    import parallel_groupby
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError('started a process pool')
+
+    store_path, csv_path, _ = paths
+    monkeypatch.setenv(parallel_groupby.WORKERS_ENV, '0')
+    monkeypatch.setattr(parallel_groupby, 'ProcessPoolExecutor', no_pool)
+    daily = get_backend('pandas', store_path, csv_path).daily_totals()
+    assert len(daily) == 120
@@ -0,0 +1,134 @@
+# Top-K spikes and dips without sorting everything
+#
+# To get the 10 best days, the scripts used to sort the whole table and take .head(10),
+# and then sort it again the other way round for the 10 worst days. Sorting n rows is
+# more work than needed when I only want 10 of them.
+# np.partition() finds the k-th largest (or smallest) value in one pass over the data,
+# without putting the rest in order, and everything on the right side of it is the
+# top-K. Then I only sort those k.
+# It also works on a whole table at once, so all products (and total_sales) get their
+# top-K in the same pass.
+#
+# Missing values never make it into the top-K unless there aren't enough real values,
+# which is the same as sort_values() putting NaN at the end.
+
+import numpy as np
+import pandas as pd
+
+
+# top_k_positions() returns, for every column of 'values' (a 2D array), the row positions
+# of its k largest (largest=True) or k smallest values, best first. The result has shape
+# (k, number of columns).
+
+def top_k_positions(values, k=10, largest=True):
+    values = np.asarray(values, dtype='float64')
+    if values.ndim == 1:
+        values = values[:, None]
+    k = min(k, len(values))
+    if k == 0:
+        return np.empty((0, values.shape[1]), dtype=int)
+
+    # I flip the sign for "largest" so both directions become "find the smallest", and
+    # turn NaN into +infinity so missing values always lose.
+    keys = -values if largest else values.copy()
+    keys[np.isnan(keys)] = np.inf
+
+    if k < len(keys):
+        # np.partition() finds the k-th best value of every column (the "threshold")
+        # in one pass. Everything better than it is in; if several rows tie with the
+        # threshold, the earliest ones fill the remaining places, which is what a
+        # stable sort followed by .head(k) would pick.
+        threshold = np.partition(keys, k - 1, axis=0)[k - 1]
+        better = keys < threshold
+        tied = keys == threshold
+        places_left = k - better.sum(axis=0)
+        selected = better | (tied & (np.cumsum(tied, axis=0) <= places_left))
+        _, rows = np.nonzero(selected.T)
+        candidates = rows.reshape(keys.shape[1], k).T
+    else:
+        candidates = np.tile(np.arange(len(keys))[:, None], (1, keys.shape[1]))
+
+    # Now I only sort the k candidates of each column. Equal values keep their original
+    # row order, so ties come out the same way every time.
+    candidate_keys = np.take_along_axis(keys, candidates, axis=0)
+    order = np.lexsort((candidates, candidate_keys), axis=0)
+    return np.take_along_axis(candidates, order, axis=0)
+
+
+# top_k_rows() is the easy version for one column: it returns the k rows of 'frame' with
+# the largest (or smallest) values in 'column', like
+# frame.sort_values(by=column, ascending=not largest).head(k).
+
+def top_k_rows(frame, column, k=10, largest=True):
+    positions = top_k_positions(frame[column].to_numpy(), k, largest)[:, 0]
+    return frame.iloc[positions]
+
+
+# spikes_and_dips() gives the k best and k worst rows for every column in 'columns' at
+# once, as two long tables with one row per (column, rank):
+#   product | rank | <frame's index, e.g. datum> | sales
+# by: optional labels per row (for example df['year'] or a year-month column) to get the
+# top-K within each period instead of over the whole history.
+
+def spikes_and_dips(frame, columns, k=10, by=None):
+    columns = list(columns)
+    if by is None:
+        groups = [(None, np.arange(len(frame)))]
+    else:
+        codes, labels = pd.factorize(pd.Series(by, index=frame.index), sort=True)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        groups = [(labels[codes[chunk[0]]], chunk) for chunk in np.split(order, bounds) if len(chunk)]
+
+    values = frame[columns].to_numpy(dtype='float64')
+    index_name = frame.index.name or 'index'
+    tables = {True: [], False: []}
+    for period, rows in groups:
+        for largest in (True, False):
+            positions = rows[top_k_positions(values[rows], k, largest)]
+            table = pd.DataFrame({
+                'product': np.repeat(columns, len(positions)),
+                'rank': np.tile(np.arange(1, len(positions) + 1), len(columns)),
+                index_name: frame.index[positions.T.ravel()],
+                'sales': np.take_along_axis(values, positions, axis=0).T.ravel(),
+            })
+            if by is not None:
+                table.insert(0, 'period', period)
+            tables[largest].append(table)
+    return pd.concat(tables[True], ignore_index=True), pd.concat(tables[False], ignore_index=True)
+
+
+# StreamingTopK keeps a running top-K while data arrives in batches (for example each
+# cleaned chunk, or each new night of data). It only ever remembers k candidates per
+# column: each update() finds the batch's own top-K in one pass and then keeps the
+# best k out of (old candidates + batch candidates), so the memory stays at
+# k x columns no matter how much data goes through it.
+
+class StreamingTopK:
+    def __init__(self, columns, k=10, largest=True):
+        self.columns = list(columns)
+        self.k = k
+        self.largest = largest
+        self.values = np.empty((0, len(self.columns)))
+        self.labels = np.empty((0, len(self.columns)), dtype=object)
+
+    def update(self, frame):
+        batch = frame[self.columns].to_numpy(dtype='float64')
+        positions = top_k_positions(batch, self.k, self.largest)
+        batch_values = np.take_along_axis(batch, positions, axis=0)
+        batch_labels = np.asarray(frame.index, dtype=object)[positions]
+
+        values = np.vstack([self.values, batch_values])
+        labels = np.vstack([self.labels, batch_labels])
+        keep = top_k_positions(values, self.k, self.largest)
+        self.values = np.take_along_axis(values, keep, axis=0)
+        self.labels = np.take_along_axis(labels, keep, axis=0)
+        return self
+
+    def result(self):
+        return pd.DataFrame({
+            'product': np.repeat(self.columns, len(self.values)),
+            'rank': np.tile(np.arange(1, len(self.values) + 1), len(self.columns)),
+            'label': self.labels.T.ravel(),
+            'sales': self.values.T.ravel(),
+        })
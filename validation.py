@@ -0,0 +1,115 @@
+# Data-quality checks for the raw sales rows
+#
+# analysis.py used to drop rows with an empty value and rows whose date couldn't be
+# read, and keep everything else. But some rows that look complete are still wrong:
+# - a negative sales number (a return booked as a sale, or a typo),
+# - a Year or Month that doesn't match the date in 'datum',
+# - a Weekday Name that isn't the weekday of that date.
+# Those rows would quietly end up in the monthly and weekday charts.
+#
+# find_problems() checks every rule on whole columns at once (numpy compares millions of
+# values in one go, there's no Python loop over the rows) and gives every row a "reason
+# code": a number where every rule has its own bit, so one number can hold several
+# problems at once. 0 means the row is fine.
+#
+#   1  missing_value       a product or calendar value is empty
+#   2  bad_date            'datum' couldn't be read as a date
+#   4  negative_sales      a product has sales below 0
+#   8  year_mismatch       Year is not the year of 'datum'
+#   16 month_mismatch      Month is not the month of 'datum'
+#   32 weekday_mismatch    Weekday Name is not the weekday of 'datum'
+#
+# For example, reason code 36 = 32 + 4: wrong weekday and a negative sale.
+# The rejected rows aren't thrown away: analysis.py writes them, exactly as they were in
+# the raw file plus their reason code, to 02_data_clean/sales_data_rejected.csv, so they
+# can be checked and fixed at the source.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+MISSING_VALUE = 1
+BAD_DATE = 2
+NEGATIVE_SALES = 4
+YEAR_MISMATCH = 8
+MONTH_MISMATCH = 16
+WEEKDAY_MISMATCH = 32
+
+REASONS = {
+    MISSING_VALUE: 'missing_value',
+    BAD_DATE: 'bad_date',
+    NEGATIVE_SALES: 'negative_sales',
+    YEAR_MISMATCH: 'year_mismatch',
+    MONTH_MISMATCH: 'month_mismatch',
+    WEEKDAY_MISMATCH: 'weekday_mismatch',
+}
+
+WEEKDAY_NUMBERS = {name: number for number, name in enumerate(
+    ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'])}
+
+
+def reason_names(code):
+    return ';'.join(name for bit, name in REASONS.items() if code & bit)
+
+
+# weekday_numbers() turns the Weekday Name column into 0 (Monday) .. 6 (Sunday), or -1
+# for a name it doesn't know. There are only 7 distinct names, so each one is looked up
+# once and factorize() spreads the result over the rows.
+
+def weekday_numbers(names):
+    codes, uniques = pd.factorize(names, use_na_sentinel=True)
+    lookup = np.array([WEEKDAY_NUMBERS.get(str(name).strip().lower(), -1) for name in uniques] + [-1])
+    return lookup[codes]  # code -1 (an empty name) picks the -1 added at the end
+
+
+# find_problems() returns the reason code of every row of a raw chunk.
+#   df: the raw rows (original column names: datum, products, Year, Month, Hour, Weekday Name)
+#   dates: 'datum' already parsed (see date_parsing.py)
+#   bad_dates: True where 'datum' has a value that couldn't be parsed
+#   products: the product columns
+
+def find_problems(df, dates, bad_dates, products):
+    reasons = np.zeros(len(df), dtype=np.uint8)
+    reasons[df.isna().to_numpy().any(axis=1)] |= MISSING_VALUE
+    reasons[bad_dates] |= BAD_DATE
+
+    sales = df[products].to_numpy(dtype='float64')
+    reasons[(sales < 0).any(axis=1)] |= NEGATIVE_SALES
+
+    # The calendar checks only make sense where both the date and the value are there
+    # (an empty one is already a missing_value).
+    dates = pd.DatetimeIndex(dates)
+    has_date = ~np.isnat(dates.to_numpy())
+    for column, date_part, bit in (('Year', dates.year, YEAR_MISMATCH), ('Month', dates.month, MONTH_MISMATCH)):
+        if column in df.columns:
+            values = df[column].to_numpy(dtype='float64')
+            reasons[has_date & ~np.isnan(values) & (values != date_part.to_numpy(dtype='float64'))] |= bit
+    if 'Weekday Name' in df.columns:
+        names = df['Weekday Name']
+        mismatch = weekday_numbers(names) != dates.dayofweek.to_numpy()
+        reasons[has_date & names.notna().to_numpy() & mismatch] |= WEEKDAY_MISMATCH
+    return reasons
+
+
+# rejected_rows() is the side output: the rejected raw rows with their reason code and
+# the reasons spelled out. Only the few distinct codes are turned into text.
+
+def rejected_rows(df, reasons):
+    rejected = df.copy()
+    rejected['reason_code'] = reasons
+    rejected['reasons'] = pd.Series(reasons, index=df.index).map(
+        {code: reason_names(code) for code in np.unique(reasons)})
+    return rejected
+
+
+def write_rejected(rejected, path, overwrite=False):
+    append = not overwrite and os.path.exists(path) and os.path.getsize(path) > 0
+    rejected.to_csv(path, index=False, mode='a' if append else 'w', header=not append)
+
+
+# count_reasons() adds up how many rejected rows had each problem (a row with two
+# problems counts for both).
+
+def count_reasons(reasons):
+    return {name: int(np.count_nonzero(reasons & bit)) for bit, name in REASONS.items()}